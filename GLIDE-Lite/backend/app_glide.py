@@ -1,27 +1,98 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Dict, Any, List, Optional
-import uuid, random, numpy as np
-
-
-app = FastAPI(title="GLIDE-Lite API", version="1.4.0")
+from typing import Dict, Any, List, Optional, Tuple
+from functools import lru_cache
+from types import MappingProxyType
+import asyncio, os, uuid, numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None  # Numba 為選配加速；未安裝時退回 NumPy 向量化路徑
+
+try:
+    import orjson  # noqa: F401 -- 僅確認可用，序列化交給 ORJSONResponse
+    from fastapi.responses import ORJSONResponse as _ResponseClass
+except ImportError:
+    # orjson 未安裝時退回內建 json 序列化
+    from fastapi.responses import JSONResponse as _ResponseClass
+
+
+def _step_cars_kernel(car_x, car_v, car_delay, car_stops, car_active, car_stopped,
+                      stoplines_x, green_flags, buf):
+    """單步汽車更新核心：位移 + 紅燈停止線限制 + 延滯/停次累計。
+
+    以平坦陣列操作撰寫，讓 Numba 能編譯成無 GIL 的機器碼；
+    未安裝 Numba 時 run_sim 會改走等價的 NumPy 向量化區塊。
+    停次用「上一步沒停、這一步停了」的邊緣偵測計數。
+    """
+    for i in range(car_x.shape[0]):
+        if not car_active[i]:
+            continue
+        x = car_x[i]
+        x_try = x + car_v[i]
+        for j in range(stoplines_x.shape[0]):
+            sx = stoplines_x[j]
+            if (not green_flags[j]) and (x + 0.1 < sx) and (x_try > sx - buf):
+                x_try = sx - buf
+        stopped = x_try == x
+        if stopped:
+            car_delay[i] += 1.0
+            if not car_stopped[i]:
+                car_stops[i] += 1
+        car_stopped[i] = stopped
+        car_x[i] = x_try
+
+
+if njit is not None:
+    _step_cars_kernel = njit(cache=True, fastmath=True)(_step_cars_kernel)
+    # 匯入時先以極小輸入觸發編譯，避免第一個請求吃掉編譯秒數
+    # （dtype 與 run_sim 的 float32 SoA 陣列一致，才會命中同一份編譯結果）
+    _step_cars_kernel(np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.float32),
+                      np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.int32),
+                      np.zeros(1, dtype=np.bool_), np.zeros(1, dtype=np.bool_),
+                      np.zeros(1, dtype=np.float32), np.zeros(1, dtype=np.bool_),
+                      np.float32(4.5))
+
+
+# frames 動輒數十萬個節點，orjson 的 C 序列化比內建 json 快數倍
+app = FastAPI(title="GLIDE-Lite API", version="1.4.0",
+              default_response_class=_ResponseClass)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
     allow_methods=["*"], allow_headers=["*"]
 )
 
+# /glide/sim 的模擬本體是純 CPU 工作，丟進 process pool 跑，
+# 事件迴圈不被卡住、多個請求也能吃滿多核（繞過 GIL）
+_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+
 # ---------------- Utilities ----------------
-def simple_compute_offsets(distances: List[float], cycle: int = 90, speed_kmh: float = 40) -> Dict[str, int]:
-    """根據節點間距與巡航速度，計算綠波 offset。"""
+@lru_cache(maxsize=128)
+def simple_compute_offsets(distances: Tuple[float, ...], cycle: int = 90, speed_kmh: float = 40) -> Dict[str, int]:
+    """根據節點間距與巡航速度，計算綠波 offset。
+
+    參數組合重複率極高（sim 路徑固定用 [300]*4），以 lru_cache 記憶；
+    回傳唯讀 MappingProxyType，避免呼叫端改動到快取內容。
+    """
     v = speed_kmh / 3.6
     offsets = {"J1": 0}
     acc = 0.0
     for i, d in enumerate(distances):
         acc += d / v
         offsets[f"J{i+2}"] = int(acc % cycle)
-    return offsets
+    return MappingProxyType(offsets)
+
+
+@lru_cache(maxsize=32)
+def _signal_tables(steps: int, cycle: int, green: int, yellow: int,
+                   offs: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """預展開 (steps × 節點) 的綠/黃燈布林表；同參數重複請求直接命中快取。"""
+    tau = (np.arange(steps)[:, None] + np.asarray(offs)[None, :]) % cycle
+    return tau < green, (tau >= green) & (tau < green + yellow)
 
 # ---------------- Models ----------------
 class TSPParams(BaseModel):
@@ -77,6 +148,7 @@ class SimRequest(BaseModel):
     anti_bunching: bool = True                          # 是否啟用 Anti-Bunching
     tsp: Optional[TSPParams] = None                     # TSP 參數物件
     bus_lines: Optional[List[BusLineSpec]] = None
+    frame_stride: int = Field(1, ge=1, le=10)           # 每 N 步輸出一張 frame（物理照跑）
 
 # ---------------- Endpoints ----------------
 @app.get("/health")
@@ -85,414 +157,460 @@ async def health():
 
 @app.post("/glide/plan")
 async def glide_plan(req: PlanRequest):
-    distances = [300, 280]
+    distances = (300, 280)
     offsets = simple_compute_offsets(distances, req.cycle, req.v_prog_kmh)
     width = int(req.cycle * 0.6)
     band = [{"node": nid, "start": off, "end": min(req.cycle, off+width), "width": width}
             for nid, off in offsets.items()]
     return {"offsets": offsets, "green_band": band}
-@app.post("/glide/sim")
-async def run_sim(req: SimRequest):
+def _sim_body(req_dict: Dict[str, Any]) -> Dict[str, Any]:
     """
     多路線公車 + 站位容量 + 反群聚 + 監控回傳
     - 相容舊 payload；若不傳 bus_lines，會用羅斯福走廊風格預設。
+    - 以 dict 收參數（跨 process 需可 pickle），進來先還原成 SimRequest。
     """
-    try:
-        session_id = f"sim_{uuid.uuid4().hex[:8]}"
-
-        
-        
-
-        # ===== 基本參數 =====
-        C = req.cycle
-        G = int(0.6 * C)
-        Y = 6
-        V = req.v_prog_kmh / 3.6
-        V_BUS = V * 0.9
-        STEPS = int(min(req.steps, 1200))
-
-        # 三個號誌（與前端畫面對齊的停止線座標）
-        stoplines = {"J1": -600.0, "J2": -300.0, "J3": 0.0, "J4": 300.0, "J5": 600.0}
-        nodes = list(stoplines.keys())
-
-        # ===== KPI 聚合容器（實際觀測）=====
-        car_exited = 0
-        car_zero_stop = 0
-        car_delay_sum = 0.0      # 累計信號延滯(秒)
-        car_stops_sum = 0        # 累計信號停次
-        car_travel_sum = 0.0     # 走廊旅行時間(秒)
-        car_exit_ts: List[int] = []  # 出場時間序列，用來算放行頭距
+    req = SimRequest(**req_dict)
+    session_id = f"sim_{uuid.uuid4().hex[:8]}"
+
+    
+    
+
+    # ===== 基本參數 =====
+    C = req.cycle
+    G = int(0.6 * C)
+    Y = 6
+    V = req.v_prog_kmh / 3.6
+    V_BUS = V * 0.9
+    STEPS = int(min(req.steps, 1200))
+
+    # 三個號誌（與前端畫面對齊的停止線座標）
+    stoplines = {"J1": -600.0, "J2": -300.0, "J3": 0.0, "J4": 300.0, "J5": 600.0}
+    nodes = list(stoplines.keys())
+    stoplines_x = np.array(list(stoplines.values()), dtype=np.float32)
+
+    # ===== KPI 聚合容器（實際觀測）=====
+    car_exited = 0
+    car_zero_stop = 0
+    car_delay_sum = 0.0      # 累計信號延滯(秒)
+    car_stops_sum = 0        # 累計信號停次
+    car_travel_sum = 0.0     # 走廊旅行時間(秒)
+    # 出場時間序列（算放行頭距用）：等知道總車數後預配 int32 陣列
 
 # 每線公車延滯彙總（信號/站前/停靠）
-        bus_delay_line: Dict[str, Dict[str, float]] = {}  # lid -> {"signal":秒, "queue":秒, "dwell":秒, "exited":數}
-
-        # offsets：固定時制 -> 全 0；GLIDE -> 由距離/速度計算
-        offsets = ({"J1": 0, "J2": 0, "J3": 0, "J4": 0, "J5": 0}
-           if req.mode == "fixed"
-           else simple_compute_offsets([300, 300, 300, 300], C, req.v_prog_kmh))
-
-        # ===== 汽車流量（尖峰時視覺更密集） =====
-        target_vph = req.cars_per_hour if req.cars_per_hour is not None else 1700
-        mu_theory = (G * 3600.0 / C) / max(1, target_vph)  # 理論頭距（秒）
-        if target_vph >= 2000:      mu_min, mu_max = 0.9, 2.2
-        elif target_vph >= 1800:    mu_min, mu_max = 1.1, 2.5
-        elif target_vph <= 800:     mu_min, mu_max = 2.8, 4.6
-        else:                        mu_min, mu_max = 1.6, 3.2
-        mu = float(np.clip(mu_theory, mu_min, mu_max))
-        sigma = 0.25 if target_vph >= 1600 else 0.35
-
-        def sample_headway():
-            return float(np.clip(np.random.lognormal(mean=np.log(mu), sigma=sigma), 0.6, 6.0))
-
-        # 綠窗內逐台出發（避免「一坨」）
-        car_depart_times: List[float] = []
-        k = 0
-        while True:
-            t0 = k * C - offsets["J1"]
-            if t0 > STEPS:
-                break
-            t = max(0.0, t0) + random.uniform(0.25, 0.9)
-            t_end = t0 + G
-
-            # 高流量：綠窗早期注入 3 台貼靠的 platoon
-            if target_vph >= 1800:
-                t_burst = max(0.0, t0) + random.uniform(0.2, 0.6)
-                for _ in range(3):
-                    if t_burst < t_end and t_burst < STEPS:
-                        car_depart_times.append(t_burst)
-                        t_burst += random.uniform(0.35, 0.6)
-
-            while t < t_end and t < STEPS:
-                car_depart_times.append(t + random.uniform(-0.10, 0.10))
-                t += sample_headway()
-            k += 1
-        car_depart_times.sort()
-
-        # ====== 2-1 公車排程（多路線） ======
-        lines: List[BusLineSpec] = req.bus_lines or [
-            BusLineSpec(id="R61", headway_sec=240, jitter_sec=30, dwell_sec=25, phase_offset_sec=0),
-            BusLineSpec(id="235", headway_sec=300, jitter_sec=35, dwell_sec=20, phase_offset_sec=60),
-            BusLineSpec(id="236", headway_sec=300, jitter_sec=35, dwell_sec=22, phase_offset_sec=120),
-            BusLineSpec(id="251", headway_sec=360, jitter_sec=40, dwell_sec=25, phase_offset_sec=180),
-            BusLineSpec(id="252", headway_sec=420, jitter_sec=45, dwell_sec=25, phase_offset_sec=210),
-            BusLineSpec(id="644", headway_sec=480, jitter_sec=50, dwell_sec=28, phase_offset_sec=240),
-        ]
-
-        schedule: Dict[str, List[float]] = {}
-        for L in lines:
-            times: List[float] = []
-            first = max(5.0, min(15.0, 0.05 * STEPS)) + (L.phase_offset_sec % max(1, L.headway_sec))
-            t_bus = first
-            while t_bus < STEPS:
-                times.append(t_bus)
-                if req.simulate_bunching and random.random() < 0.25:
-                    g = random.uniform(0.3 * L.headway_sec, 0.55 * L.headway_sec)
-                    if t_bus + g < STEPS:
-                        times.append(t_bus + g)
-                jitter = random.uniform(-L.jitter_sec, L.jitter_sec)
-                t_bus = max(0.0, t_bus + L.headway_sec + jitter)
-            times.sort()
-            schedule[L.id] = times
-
-        # ====== 2-2 站點/容量 + 監控 ======
-        #bus_stops = [-350.0, 750.0]   # 園區側 / 過橋後
-        bus_stops = [-450.0, 450.0]
-
-        stop_name = {bus_stops[0]: "S1_園區側", bus_stops[1]: "S2_竹北側"}
-        STOP_BERTHS = 2
-
-        monitor = {
-            "lines": {L.id: {
-                "scheduled_headway_sec": L.headway_sec,
-                "arrivals": 0, "holds": 0, "tsp_extends": 0, "queue_holds": 0,
-                "arr_times": [],
-            } for L in lines},
-            "stops": { stop_name[sx]: {"arrivals": 0, "avg_dwell": 0.0, "sum_dwell": 0.0,
-                                       "queue_max": 0, "queue_now": 0} for sx in bus_stops }
-        }
-        stop_occupancy: Dict[float, List[str]] = {sx: [] for sx in bus_stops}
-        stop_release_time: Dict[float, List[int]] = {sx: [] for sx in bus_stops}
-        last_arrival_time: Dict[float, Optional[int]] = {sx: None for sx in bus_stops}
-
-        # ====== 主回圈 ======
-        def ew_state(nid: str, t_int: int) -> str:
-            tau = (t_int + offsets.get(nid, 0)) % C
-            if tau < G: return "G"
-            if tau < G + Y: return "y"
-            return "r"
-
-        X_MIN, X_MAX = -800.0, 800.0
-        vehicles: List[Dict[str, Any]] = []
-        frames: List[Dict[str, Any]] = []
-        events: List[Dict[str, Any]] = []
-        arrived = 0
-        car_i = 0
-        bus_spawn_index: Dict[str, int] = {L.id: 0 for L in lines}
-
-        COINCIDENCE_WINDOW = 18
-        PRESTOP_HOLD = 16.0
-        STOPLINE_BUFFER = 4.5
-
-        def next_stopline_x(x_now: float):
-            nxt = [sx for sx in stoplines.values() if sx > x_now + 0.1]
-            return min(nxt) if nxt else None
-
-        def update_one(v: Dict[str, Any], t_int: int, green_now: Dict[str, bool]):
-            x, vel = v["x"], v["v"]
-            x_try = x + vel
-
-            # ----- 公車 -----
-            if v["kind"] == "bus":
-                # 仍在停靠
-                if v.get("dwell_until") is not None:
-                    if t_int < v["dwell_until"]:
-                        v["stopped"] = True
-                        v["stopped_at_station"] = True
+    bus_delay_line: Dict[str, Dict[str, float]] = {}  # lid -> {"signal":秒, "queue":秒, "dwell":秒, "exited":數}
+
+    # offsets：固定時制 -> 全 0；GLIDE -> 由距離/速度計算
+    offsets = ({"J1": 0, "J2": 0, "J3": 0, "J4": 0, "J5": 0}
+       if req.mode == "fixed"
+       else simple_compute_offsets((300, 300, 300, 300), C, req.v_prog_kmh))
+
+    # 預先展開整段模擬的號誌狀態表：主回圈直接查表，不再每步做模運算
+    green_table, yellow_table = _signal_tables(
+        STEPS, C, G, Y, tuple(offsets.get(nid, 0) for nid in nodes))
+
+    # ===== 汽車流量（尖峰時視覺更密集） =====
+    target_vph = req.cars_per_hour if req.cars_per_hour is not None else 1700
+    mu_theory = (G * 3600.0 / C) / max(1, target_vph)  # 理論頭距（秒）
+    if target_vph >= 2000:      mu_min, mu_max = 0.9, 2.2
+    elif target_vph >= 1800:    mu_min, mu_max = 1.1, 2.5
+    elif target_vph <= 800:     mu_min, mu_max = 2.8, 4.6
+    else:                        mu_min, mu_max = 1.6, 3.2
+    mu = float(np.clip(mu_theory, mu_min, mu_max))
+    sigma = 0.25 if target_vph >= 1600 else 0.35
+
+    # 單一 Generator 統一供應整個請求的亂數，批次抽樣取代逐筆 scalar 呼叫
+    rng = np.random.default_rng()
+
+    # 綠窗內逐台出發（避免「一坨」）— 以 NumPy 批次抽樣取代逐台 while 迴圈
+    depart_chunks: List[np.ndarray] = []
+    n_est = int(1.5 * (G / mu)) + 4  # 每個綠窗的頭距抽樣上限
+    for k in range(int(STEPS // C) + 2):
+        t0 = k * C - offsets["J1"]
+        if t0 > STEPS:
+            break
+        t_end = t0 + G
+        t_start = max(0.0, t0) + rng.uniform(0.25, 0.9)
+
+        # 高流量：綠窗早期注入 3 台貼靠的 platoon
+        if target_vph >= 1800:
+            burst = (max(0.0, t0) + rng.uniform(0.2, 0.6)
+                     + np.concatenate(([0.0], np.cumsum(rng.uniform(0.35, 0.6, 2)))))
+            depart_chunks.append(burst[(burst < t_end) & (burst < STEPS)])
+
+        # 一次抽滿整個綠窗的頭距，累積和即各車出發時刻
+        h = np.clip(rng.lognormal(mean=np.log(mu), sigma=sigma, size=n_est), 0.6, 6.0)
+        ts = t_start + np.concatenate(([0.0], np.cumsum(h)[:-1]))
+        ts = ts[(ts < t_end) & (ts < STEPS)]
+        depart_chunks.append(ts + rng.uniform(-0.10, 0.10, ts.size))
+
+    car_depart_times = (np.sort(np.concatenate(depart_chunks))
+                        if depart_chunks else np.empty(0))
+
+    # ===== 汽車狀態改用 SoA（Structure-of-Arrays）=====
+    # 逐車 dict 會在主回圈內做大量鍵查找與逐筆更新；
+    # 改為平行的 NumPy 陣列後，位移/紅燈限制/延滯統計都能整批向量化。
+    # float32 足以涵蓋 ±800m 座標與 ≤1200s 的延滯，頻寬/快取都省一半
+    n_cars = len(car_depart_times)
+    # 出場數不會超過出發數，直接預配滿額，append 改成游標寫入
+    car_exit_ts = np.empty(n_cars, dtype=np.int32)
+    car_exit_k = 0
+    car_x = np.empty(n_cars, dtype=np.float32)
+    car_y = rng.uniform(-2, 2, n_cars).astype(np.float32)
+    car_v = (V * rng.uniform(0.92, 1.05, n_cars)).astype(np.float32)
+    car_enter = np.empty(n_cars, dtype=np.float32)
+    car_delay = np.zeros(n_cars, dtype=np.float32)
+    car_stops = np.zeros(n_cars, dtype=np.int32)
+    car_active = np.zeros(n_cars, dtype=bool)
+    car_stopped = np.zeros(n_cars, dtype=bool)
+
+    # ====== 2-1 公車排程（多路線） ======
+    lines: List[BusLineSpec] = req.bus_lines or [
+        BusLineSpec(id="R61", headway_sec=240, jitter_sec=30, dwell_sec=25, phase_offset_sec=0),
+        BusLineSpec(id="235", headway_sec=300, jitter_sec=35, dwell_sec=20, phase_offset_sec=60),
+        BusLineSpec(id="236", headway_sec=300, jitter_sec=35, dwell_sec=22, phase_offset_sec=120),
+        BusLineSpec(id="251", headway_sec=360, jitter_sec=40, dwell_sec=25, phase_offset_sec=180),
+        BusLineSpec(id="252", headway_sec=420, jitter_sec=45, dwell_sec=25, phase_offset_sec=210),
+        BusLineSpec(id="644", headway_sec=480, jitter_sec=50, dwell_sec=28, phase_offset_sec=240),
+    ]
+    # 進站熱路徑用的路線查表，免得每次到站都線性掃 lines
+    line_by_id: Dict[str, BusLineSpec] = {L.id: L for L in lines}
+
+    def _gen_line_schedule(L: BusLineSpec) -> np.ndarray:
+        """單一路線的發車時刻表：班距+抖動累積和一次抽完，不再逐班 while。"""
+        hw = max(1, L.headway_sec)
+        first = max(5.0, min(15.0, 0.05 * STEPS)) + (L.phase_offset_sec % hw)
+        n_max = int(STEPS / hw) + 4
+        jit = rng.uniform(-L.jitter_sec, L.jitter_sec, n_max)
+        arrivals = first + np.concatenate(([0.0], np.cumsum(hw + jit)[:-1]))
+        arrivals = arrivals[arrivals < STEPS]
+        if req.simulate_bunching and arrivals.size:
+            # 25% 機率在班次後追加一班「群聚」車
+            burst_mask = rng.random(arrivals.size) < 0.25
+            gaps = rng.uniform(0.3 * hw, 0.55 * hw, arrivals.size)
+            extra = arrivals[burst_mask] + gaps[burst_mask]
+            arrivals = np.concatenate([arrivals, extra[extra < STEPS]])
+        return np.sort(arrivals)
+
+    schedule: Dict[str, np.ndarray] = {L.id: _gen_line_schedule(L) for L in lines}
+
+    # ====== 2-2 站點/容量 + 監控 ======
+    #bus_stops = [-350.0, 750.0]   # 園區側 / 過橋後
+    bus_stops = [-450.0, 450.0]
+
+    stop_name = {bus_stops[0]: "S1_園區側", bus_stops[1]: "S2_竹北側"}
+    STOP_BERTHS = 2
+
+    monitor = {
+        "lines": {L.id: {
+            "scheduled_headway_sec": L.headway_sec,
+            "arrivals": 0, "holds": 0, "tsp_extends": 0, "queue_holds": 0,
+            "arr_times": [],
+        } for L in lines},
+        "stops": { stop_name[sx]: {"arrivals": 0, "avg_dwell": 0.0, "sum_dwell": 0.0,
+                                   "queue_max": 0, "queue_now": 0} for sx in bus_stops }
+    }
+    # bus_id -> 預計離站時間；dict 讓離站釋放佔位是 O(1)，不用線性掃描
+    stop_occupancy: Dict[float, Dict[str, int]] = {sx: {} for sx in bus_stops}
+    last_arrival_time: Dict[float, Optional[int]] = {sx: None for sx in bus_stops}
+
+    # ====== 主回圈 ======
+    X_MIN, X_MAX = -800.0, 800.0
+    buses: List[Dict[str, Any]] = []
+    frames: List[Dict[str, Any]] = []
+    events: List[Dict[str, Any]] = []
+    arrived = 0
+    car_i = 0
+    bus_spawn_index: Dict[str, int] = {L.id: 0 for L in lines}
+
+    COINCIDENCE_WINDOW = 18
+    PRESTOP_HOLD = 16.0
+    STOPLINE_BUFFER = 4.5
+
+    def update_one(v: Dict[str, Any], t_int: int, green_row: np.ndarray):
+        """逐台更新公車（汽車已向量化，不再走這條路徑）。"""
+        x, vel = v["x"], v["v"]
+        x_try = x + vel
+
+        # ----- 公車 -----
+        if v["kind"] == "bus":
+            # 仍在停靠
+            if v.get("dwell_until") is not None:
+                if t_int < v["dwell_until"]:
+                    v["stopped"] = True
+                    v["stopped_at_station"] = True
+                    v["x"] = x
+                    return v
+                else:
+                    sx0 = v.get("at_stop")
+                    if sx0 is not None:
+                        # 離站：釋放佔位
+                        stop_occupancy[sx0].pop(v["id"], None)
+                        v.setdefault("served_stops", []).append(sx0)
+                        v["dwell_until"] = None
+                        v.pop("stopped_at_station", None)
+                        v.pop("at_stop", None)
+                        x = max(x, sx0 + 0.2); x_try = max(x_try, sx0 + 0.2)
                         v["x"] = x
-                        return v
-                    else:
-                        sx0 = v.get("at_stop")
-                        if sx0 is not None:
-                            # 離站：釋放佔位
-                            name = stop_name[sx0]
-                            if v["id"] in stop_occupancy[sx0]:
-                                i_rm = stop_occupancy[sx0].index(v["id"])
-                                stop_occupancy[sx0].pop(i_rm)
-                                stop_release_time[sx0].pop(i_rm)
-                            v.setdefault("served_stops", []).append(sx0)
-                            v["dwell_until"] = None
-                            v.pop("stopped_at_station", None)
-                            v.pop("at_stop", None)
-                            x = max(x, sx0 + 0.2); x_try = max(x_try, sx0 + 0.2)
-                            v["x"] = x
-
-                # 檢查是否將跨越某站
-                for sx in bus_stops:
-                    if sx in v.get("served_stops", []):
-                        pass
-                    if x < sx <= x_try:
-                        name = stop_name[sx]
-                        occ = stop_occupancy[sx]
-                        # 站位滿或短時間已有到站 → 站前 queue hold
-                        if len(occ) >= STOP_BERTHS or (last_arrival_time[sx] is not None and (t_int - last_arrival_time[sx]) <= COINCIDENCE_WINDOW):
-                            v["x"] = sx - PRESTOP_HOLD
-                            v["stopped"] = True
-                            v["queueing"] = True
-                            monitor["lines"][v.get("line", "BUS")]["queue_holds"] += 1
-                            return v
-
-                        # 允許進站：開始 dwell
-                        # 若有多線設定，用該線的專屬 dwell；否則用全域 dwell
-                        dwell_cfg = req.dwell_sec
-                        if req.bus_lines is not None:
-                            for L in lines:
-                                if L.id == v.get("line"):
-                                    dwell_cfg = L.dwell_sec
-                                    break
-                        v["dwell_until"] = t_int + int(dwell_cfg)
-                        v["at_stop"] = sx
-                        v["x"] = sx - 0.1
+
+            # 檢查是否將跨越某站
+            for sx in bus_stops:
+                if sx in v.get("served_stops", []):
+                    pass
+                if x < sx <= x_try:
+                    name = stop_name[sx]
+                    occ = stop_occupancy[sx]
+                    # 站位滿或短時間已有到站 → 站前 queue hold
+                    if len(occ) >= STOP_BERTHS or (last_arrival_time[sx] is not None and (t_int - last_arrival_time[sx]) <= COINCIDENCE_WINDOW):
+                        v["x"] = sx - PRESTOP_HOLD
                         v["stopped"] = True
-                        v["stopped_at_station"] = True
-                        v["queueing"] = False
-
-                        # 佔位/監控
-                        occ.append(v["id"])
-                        stop_release_time[sx].append(v["dwell_until"])
-                        last_arrival_time[sx] = t_int
-                        mon_s = monitor["stops"][name]
-                        mon_s["arrivals"] += 1
-                        dwell_now = v["dwell_until"] - t_int
-                        mon_s["sum_dwell"] += dwell_now
-                        mon_s["avg_dwell"] = mon_s["sum_dwell"] / mon_s["arrivals"]
-                        mon_s["queue_now"] = max(0, len(occ) - STOP_BERTHS)
-                        mon_s["queue_max"] = max(mon_s["queue_max"], mon_s["queue_now"])
-                        lid = v.get("line", "BUS")
-                        monitor["lines"][lid]["arrivals"] += 1
-                        monitor["lines"][lid]["arr_times"].append(t_int)
+                        v["queueing"] = True
+                        monitor["lines"][v.get("line", "BUS")]["queue_holds"] += 1
                         return v
 
-            # ----- 紅/黃燈停止線限制（避免闖紅燈） -----
-            sx_next = next_stopline_x(x)
-            if sx_next is not None:
-                nid = min(stoplines, key=lambda k: abs(stoplines[k] - sx_next))
-                if not green_now.get(nid, False) and x < sx_next:
-                    x_try = min(x_try, sx_next - STOPLINE_BUFFER)
-
-            v["x"] = x_try
-            v["stopped"] = (v["x"] == x)
-            v.pop("stopped_at_station", None)
-            return v
-
-                # ===== 模擬時間步 =====
-        for t in range(STEPS):
-            # 進汽車
-            while car_i < len(car_depart_times) and car_depart_times[car_i] < t + 1.0:
-                dt = max(0.0, car_depart_times[car_i] - t)
-                vehicles.append({
-                    "id": f"car_{car_i}",
-                    "x": X_MIN + V * dt,
-                    "y": random.uniform(-2, 2),
-                    "kind": "car",
-                    "v": V * random.uniform(0.92, 1.05),
+                    # 允許進站：開始 dwell
+                    # 若有多線設定，用該線的專屬 dwell；否則用全域 dwell
+                    dwell_cfg = req.dwell_sec
+                    if req.bus_lines is not None:
+                        L_cfg = line_by_id.get(v.get("line"))
+                        if L_cfg is not None:
+                            dwell_cfg = L_cfg.dwell_sec
+                    v["dwell_until"] = t_int + int(dwell_cfg)
+                    v["at_stop"] = sx
+                    v["x"] = sx - 0.1
+                    v["stopped"] = True
+                    v["stopped_at_station"] = True
+                    v["queueing"] = False
+
+                    # 佔位/監控
+                    occ[v["id"]] = v["dwell_until"]
+                    last_arrival_time[sx] = t_int
+                    mon_s = monitor["stops"][name]
+                    mon_s["arrivals"] += 1
+                    dwell_now = v["dwell_until"] - t_int
+                    mon_s["sum_dwell"] += dwell_now
+                    mon_s["avg_dwell"] = mon_s["sum_dwell"] / mon_s["arrivals"]
+                    mon_s["queue_now"] = max(0, len(occ) - STOP_BERTHS)
+                    mon_s["queue_max"] = max(mon_s["queue_max"], mon_s["queue_now"])
+                    lid = v.get("line", "BUS")
+                    monitor["lines"][lid]["arrivals"] += 1
+                    monitor["lines"][lid]["arr_times"].append(t_int)
+                    return v
+
+        # ----- 紅/黃燈停止線限制（避免闖紅燈） -----
+        j = int(np.searchsorted(stoplines_x, x + 0.1))
+        if j < stoplines_x.size and not green_row[j]:
+            x_try = min(x_try, float(stoplines_x[j]) - STOPLINE_BUFFER)
+
+        v["x"] = x_try
+        v["stopped"] = (v["x"] == x)
+        v.pop("stopped_at_station", None)
+        return v
+
+            # ===== 模擬時間步 =====
+    for t in range(STEPS):
+        # 進汽車（填入 SoA 陣列）
+        while car_i < n_cars and car_depart_times[car_i] < t + 1.0:
+            dt = max(0.0, float(car_depart_times[car_i]) - t)
+            car_x[car_i] = X_MIN + V * dt
+            car_enter[car_i] = t + dt
+            car_active[car_i] = True
+            car_i += 1
+
+        # 進公車（多路線）
+        for L in lines:
+            times = schedule[L.id]
+            idx = bus_spawn_index[L.id]
+            while idx < len(times) and times[idx] < t + 1.0:
+                dt = max(0.0, float(times[idx]) - t)
+                buses.append({
+                    "id": f"bus_{L.id}_{idx}",
+                    "line": L.id,
+                    "x": X_MIN + V_BUS * dt,
+                    "y": 0.0,
+                    "kind": "bus",
+                    "v": V_BUS,
                     "stopped": False,
+                    "dwell_until": None,
+                    "served_stops": [],
+                    "at_stop": None,
+                    "queueing": False,
                     "enter_t": t + dt,
+                    "signal_delay_s": 0.0,
+                    "queue_hold_s": 0.0,
+                    "dwell_s": 0.0,
                     "stops_count": 0,
-                    "delay_s": 0.0,
                 })
-                car_i += 1
-
-            # 進公車（多路線）
-            for L in lines:
-                times = schedule[L.id]
-                idx = bus_spawn_index[L.id]
-                while idx < len(times) and times[idx] < t + 1.0:
-                    dt = max(0.0, times[idx] - t)
-                    vehicles.append({
-                        "id": f"bus_{L.id}_{idx}",
-                        "line": L.id,
-                        "x": X_MIN + V_BUS * dt,
-                        "y": 0.0,
-                        "kind": "bus",
-                        "v": V_BUS,
-                        "stopped": False,
-                        "dwell_until": None,
-                        "served_stops": [],
-                        "at_stop": None,
-                        "queueing": False,
-                        "enter_t": t + dt,
-                        "signal_delay_s": 0.0,
-                        "queue_hold_s": 0.0,
-                        "dwell_s": 0.0,
-                        "stops_count": 0,
-                    })
-                    idx += 1
-                bus_spawn_index[L.id] = idx
-
-            # 號誌
-            signals = [{"node": nid, "state": ew_state(nid, t)} for nid in nodes]
-            green_now = {s["node"]: (s["state"] == "G") for s in signals}
-
-            # 主回圈內部：更新所有車輛、計分、出場
-            moved: List[Dict[str, Any]] = []
-            out_count = 0
-
-            for v in sorted(vehicles, key=lambda z: 0 if z["kind"] == "bus" else 1):
-                nv = update_one(v, t, green_now)
-
-                # 每秒統計（依車種）
-                if nv["kind"] == "car":
-                    if nv.get("stopped", False):
-                        nv["delay_s"] = nv.get("delay_s", 0.0) + 1.0
-                else:  # bus
-                    if nv.get("stopped_at_station"):
-                        nv["dwell_s"] = nv.get("dwell_s", 0.0) + 1.0
-                    elif nv.get("queueing"):
-                        nv["queue_hold_s"] = nv.get("queue_hold_s", 0.0) + 1.0
-                    elif nv.get("stopped", False):
-                        nv["signal_delay_s"] = nv.get("signal_delay_s", 0.0) + 1.0
-
-                # 出場處理
-                if nv["x"] > X_MAX + 30:
-                    out_count += 1
-                    if nv["kind"] == "car":
-                        car_exited += 1
-                        if nv.get("stops_count", 0) == 0:
-                            car_zero_stop += 1
-                        car_delay_sum += nv.get("delay_s", 0.0)
-                        car_stops_sum += nv.get("stops_count", 0)
-                        car_travel_sum += (t + 1.0) - nv.get("enter_t", t + 1.0)
-                        car_exit_ts.append(t + 1)
-                    else:
-                        lid = nv.get("line", "BUS")
-                        d = bus_delay_line.setdefault(lid, {"signal": 0.0, "queue": 0.0, "dwell": 0.0, "exited": 0})
-                        d["signal"] += nv.get("signal_delay_s", 0.0)
-                        d["queue"]  += nv.get("queue_hold_s", 0.0)
-                        d["dwell"]  += nv.get("dwell_s", 0.0)
-                        d["exited"] += 1
-                    continue  # 出場的不保留在場內
-
-                moved.append(nv)
-
-            vehicles = moved
-            arrived += out_count
-
-            # 渲染抽樣（公車全保留）
-            buses = [v for v in vehicles if v["kind"] == "bus"]
-            cars  = [v for v in vehicles if v["kind"] == "car"]
-            render: List[Dict[str, Any]] = []
-            render.extend({
-                "id": v["id"], "x": v["x"], "y": v["y"], "kind": v["kind"],
-                "line": v.get("line"),
-                "stopped": v.get("stopped", False),
-                "stopped_at_station": v.get("stopped_at_station", False)
-            } for v in buses)
-            MAX_CARS_CAP = 220 if target_vph < 1200 else (320 if target_vph < 1800 else 500)
-            max_cars = max(0, MAX_CARS_CAP - len(render))
-            if len(cars) > max_cars and max_cars > 0:
-                step = max(1, len(cars) // max_cars)
-                for i, v in enumerate(cars):
-                    if i % step == 0:
-                        render.append({"id": v["id"], "x": v["x"], "y": v["y"],
-                                       "kind": v["kind"], "stopped": v.get("stopped", False)})
-            else:
-                render.extend({"id": v["id"], "x": v["x"], "y": v["y"],
-                               "kind": v["kind"], "stopped": v.get("stopped", False)} for v in cars)
-
-            frames.append({"t": t, "signals": signals, "vehicles": render})
-
-        # ===== KPI =====
-        
-        estimated_vph = int(round(car_exited * 3600.0 / max(1, STEPS)))
-        avg_headway = (float(np.mean(np.diff(car_exit_ts))) if len(car_exit_ts) >= 2 else None)
-        kpis = {
-            "mode": req.mode,
-            "frames": len(frames),
-            # 走廊汽車績效（純信號影響，因為模型無車跟車阻滯）
-            "estimated_vph": estimated_vph,
-            "avg_discharge_headway_s": (round(avg_headway, 2) if avg_headway is not None else None),
-            "progression_rate": round(car_zero_stop / max(1, car_exited), 4),  # 零停車率
-            "avg_stops_main": round(car_stops_sum / max(1, car_exited), 3),
-            "avg_delay_main": round(car_delay_sum / max(1, car_exited), 2),     # 每車平均信號延滯(秒)
-            "avg_travel_time_s": round(car_travel_sum / max(1, car_exited), 2), # 走廊旅行時間(秒)
-            "target_vph": int(target_vph),
-            "total_arrived": arrived,
-            "target_vph": int(target_vph),
-            "total_arrived": arrived,
-        }
-
-        # ===== 2-6 監控：計算各線觀測頭距/準點率 =====
-        for lid, stats in monitor["lines"].items():
-            ts = stats["arr_times"]
-            if len(ts) >= 2:
-                diffs = [ts[i] - ts[i-1] for i in range(1, len(ts))]
-                avg = sum(diffs) / len(diffs)
-                var = sum((d - avg) ** 2 for d in diffs) / len(diffs)
-                stats["observed_headway_avg"] = round(avg, 1)
-                stats["observed_headway_std"] = round(var ** 0.5, 1)
-                tol = req.ab_tolerance_sec
-                target = stats["scheduled_headway_sec"]
-                stats["on_time_pct"] = round(100.0 * sum(1 for d in diffs if abs(d - target) <= tol) / len(diffs), 1)
-            else:
-                stats["observed_headway_avg"] = None
-                stats["observed_headway_std"] = None
-                stats["on_time_pct"] = None
-            stats.pop("arr_times", None)
-
-        # ===== 回傳 =====
-        return {
-            "session_id": session_id,
-            "frames": frames,
-            "kpis": kpis,
-            "events": events,
-            "monitor": monitor,   # ★ 前端可顯示監控卡片
-            "success": True
-        }
+                idx += 1
+            bus_spawn_index[L.id] = idx
+
+        # 號誌（查表）
+        green_row = green_table[t]
+        yellow_row = yellow_table[t]
+
+        # 主回圈內部：先逐台更新公車、計分、出場
+        # vehicles 內只剩公車（汽車已拆到 SoA 陣列），維持進場順序即可，毋須排序
+        moved: List[Dict[str, Any]] = []
+        out_count = 0
+
+        for v in buses:
+            nv = update_one(v, t, green_row)
+
+            # 每秒統計
+            if nv.get("stopped_at_station"):
+                nv["dwell_s"] = nv.get("dwell_s", 0.0) + 1.0
+            elif nv.get("queueing"):
+                nv["queue_hold_s"] = nv.get("queue_hold_s", 0.0) + 1.0
+            elif nv.get("stopped", False):
+                nv["signal_delay_s"] = nv.get("signal_delay_s", 0.0) + 1.0
+
+            # 出場處理
+            if nv["x"] > X_MAX + 30:
+                out_count += 1
+                lid = nv.get("line", "BUS")
+                d = bus_delay_line.setdefault(lid, {"signal": 0.0, "queue": 0.0, "dwell": 0.0, "exited": 0})
+                d["signal"] += nv.get("signal_delay_s", 0.0)
+                d["queue"]  += nv.get("queue_hold_s", 0.0)
+                d["dwell"]  += nv.get("dwell_s", 0.0)
+                d["exited"] += 1
+                continue  # 出場的不保留在場內
+
+            moved.append(nv)
+
+        buses = moved
+
+        # 汽車整批更新：位移 → 紅燈停止線限制 → 延滯 → 出場
+        act = car_active[:car_i]
+        if njit is not None:
+            _step_cars_kernel(car_x[:car_i], car_v[:car_i], car_delay[:car_i],
+                              car_stops[:car_i], act, car_stopped[:car_i],
+                              stoplines_x, green_row, np.float32(STOPLINE_BUFFER))
+        else:
+            xs = car_x[:car_i]
+            x_try = xs + car_v[:car_i]
+            # 一次 searchsorted 找出每台車的下一條停止線，整批套紅燈限制
+            nxt = np.searchsorted(stoplines_x, xs + np.float32(0.1), side="right")
+            ahead = act & (nxt < stoplines_x.size)
+            nxt_c = np.minimum(nxt, stoplines_x.size - 1)
+            red_mask = ahead & ~green_row[nxt_c]
+            np.minimum(x_try, stoplines_x[nxt_c] - np.float32(STOPLINE_BUFFER),
+                       out=x_try, where=red_mask)
+            # 融合成同一趟向量掃描：延滯累計 + 停次邊緣偵測 + 狀態覆寫
+            stopped_now = act & (x_try == xs)
+            car_delay[:car_i] += stopped_now  # 停等中每秒累加 1 秒延滯
+            car_stops[:car_i] += stopped_now & ~car_stopped[:car_i]
+            car_stopped[:car_i] = stopped_now
+            car_x[:car_i] = np.where(act, x_try, xs)
+
+        exit_mask = act & (car_x[:car_i] > X_MAX + 30)
+        n_exit = int(np.count_nonzero(exit_mask))
+        if n_exit:
+            car_exited += n_exit
+            car_zero_stop += int(np.count_nonzero(car_stops[:car_i][exit_mask] == 0))
+            car_delay_sum += float(car_delay[:car_i][exit_mask].sum())
+            car_stops_sum += int(car_stops[:car_i][exit_mask].sum())
+            car_travel_sum += float(((t + 1.0) - car_enter[:car_i][exit_mask]).sum())
+            car_exit_ts[car_exit_k:car_exit_k + n_exit] = t + 1
+            car_exit_k += n_exit
+            car_active[:car_i] &= ~exit_mask
+
+        arrived += out_count + n_exit
+
+        # 非輸出步直接跳過 render/frame 組裝（frame_stride > 1 時省掉大半序列化量）
+        if t % req.frame_stride != 0:
+            continue
+
+        signals = [{"node": nid,
+                    "state": "G" if green_row[j] else ("y" if yellow_row[j] else "r")}
+                   for j, nid in enumerate(nodes)]
+
+        # 渲染抽樣（公車全保留）
+        render: List[Dict[str, Any]] = []
+        render.extend({
+            "id": v["id"], "x": v["x"], "y": v["y"], "kind": v["kind"],
+            "line": v.get("line"),
+            "stopped": v.get("stopped", False),
+            "stopped_at_station": v.get("stopped_at_station", False)
+        } for v in buses)
+        MAX_CARS_CAP = 220 if target_vph < 1200 else (320 if target_vph < 1800 else 500)
+        max_cars = max(0, MAX_CARS_CAP - len(render))
+        cars_idx = np.flatnonzero(car_active[:car_i])
+        if len(cars_idx) > max_cars and max_cars > 0:
+            step = max(1, len(cars_idx) // max_cars)
+            cars_idx = cars_idx[::step]
+        # tolist() 一次轉成 Python 標量，省掉逐元素 float()/bool() 呼叫
+        render.extend({"id": f"car_{i}", "x": x, "y": y, "kind": "car", "stopped": s}
+                      for i, x, y, s in zip(cars_idx.tolist(),
+                                            car_x[cars_idx].tolist(),
+                                            car_y[cars_idx].tolist(),
+                                            car_stopped[cars_idx].tolist()))
+
+        frames.append({"t": t, "signals": signals, "vehicles": render})
+
+    # ===== KPI =====
+    
+    estimated_vph = int(round(car_exited * 3600.0 / max(1, STEPS)))
+    avg_headway = (float(np.diff(car_exit_ts[:car_exit_k]).mean()) if car_exit_k >= 2 else None)
+    kpis = {
+        "mode": req.mode,
+        "frames": len(frames),
+        # 走廊汽車績效（純信號影響，因為模型無車跟車阻滯）
+        "estimated_vph": estimated_vph,
+        "avg_discharge_headway_s": (round(avg_headway, 2) if avg_headway is not None else None),
+        "progression_rate": round(car_zero_stop / max(1, car_exited), 4),  # 零停車率
+        "avg_stops_main": round(car_stops_sum / max(1, car_exited), 3),
+        "avg_delay_main": round(car_delay_sum / max(1, car_exited), 2),     # 每車平均信號延滯(秒)
+        "avg_travel_time_s": round(car_travel_sum / max(1, car_exited), 2), # 走廊旅行時間(秒)
+        "target_vph": int(target_vph),
+        "total_arrived": arrived,
+        "target_vph": int(target_vph),
+        "total_arrived": arrived,
+    }
+
+    # ===== 2-6 監控：計算各線觀測頭距/準點率 =====
+    for lid, stats in monitor["lines"].items():
+        ts = stats["arr_times"]
+        if len(ts) >= 2:
+            # 以 NumPy 一次算完頭距平均/標準差/準點率，取代逐筆 Python 迴圈
+            diffs = np.diff(np.asarray(ts, dtype=np.float64))
+            stats["observed_headway_avg"] = round(float(diffs.mean()), 1)
+            stats["observed_headway_std"] = round(float(diffs.std()), 1)
+            tol = req.ab_tolerance_sec
+            target = stats["scheduled_headway_sec"]
+            on_time = int(np.count_nonzero(np.abs(diffs - target) <= tol))
+            stats["on_time_pct"] = round(100.0 * on_time / diffs.size, 1)
+        else:
+            stats["observed_headway_avg"] = None
+            stats["observed_headway_std"] = None
+            stats["on_time_pct"] = None
+        stats.pop("arr_times", None)
+
+    # ===== 回傳 =====
+    return {
+        "session_id": session_id,
+        "frames": frames,
+        "kpis": kpis,
+        "events": events,
+        "monitor": monitor,   # ★ 前端可顯示監控卡片
+        "success": True
+    }
+
+
+@app.post("/glide/sim")
+async def run_sim(req: SimRequest):
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_POOL, _sim_body, req.model_dump())
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 if __name__ == "__main__":
     import uvicorn
+    dev = bool(os.getenv("DEV"))
     # 改成 8000，和前端 API_BASE 一致
-    uvicorn.run(app, host="127.0.0.1", port=8000, reload=True, log_config=None, access_log=False )
+    # reload 只留給開發模式（多一個 watcher 子行程）；正式跑多 worker
+    # 吃滿多核。workers>1 必須用 "module:app" 字串形式。
+    uvicorn.run("app_glide:app", host="127.0.0.1", port=8000,
+                reload=dev,
+                workers=1 if dev else max(1, (os.cpu_count() or 2) // 2),
+                log_config=None, access_log=False)
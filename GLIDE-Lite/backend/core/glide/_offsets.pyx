@@ -0,0 +1,38 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""
+offsets 熱路徑的 Cython 編譯版（可選）
+
+Numba 冷啟動編譯延遲不可接受的部署環境可改用本擴充，
+行為與 offsets.py 的純 Python/NumPy 路徑一致：
+
+    cythonize -i backend/core/glide/_offsets.pyx
+
+未編譯時 offsets.py 會自動退回原路徑。
+"""
+
+
+def compute_offsets_c(double[::1] distances, int cycle_s, double inv_v_ms):
+    """C 迴圈版 offset 計算；語意同 _compute_offsets_np。"""
+    cdef Py_ssize_t n = distances.shape[0]
+    cdef Py_ssize_t i
+    cdef double acc = 0.0
+    cdef list out = [0]
+    for i in range(n):
+        acc += distances[i] * inv_v_ms
+        out.append(<long>acc % cycle_s)
+    return out
+
+
+def validate_offsets_c(long long[::1] offsets, int cycle_s):
+    """C 迴圈版 offset 驗證；語意同 validate_offsets。
+
+    簽名固定 64 位元（long 在 Windows 上是 32 位元，會吃不下 int64 陣列）。
+    """
+    cdef Py_ssize_t n = offsets.shape[0]
+    cdef Py_ssize_t i
+    if n == 0 or offsets[0] != 0:
+        return False
+    for i in range(n):
+        if offsets[i] < 0 or offsets[i] >= cycle_s:
+            return False
+    return True
@@ -0,0 +1,35 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""
+tsp 熱路徑的 Cython 編譯版（可選）
+
+沒裝 Numba 的部署環境可改用本擴充，行為與 tsp.py 的
+純 Python 決策核心一致：
+
+    cythonize -i backend/core/glide/_tsp_fast.pyx
+
+未編譯時 tsp.py 會自動退回原路徑。
+"""
+
+
+cpdef tuple tsp_policy_c(double h_now, double H, double delta,
+                         int max_ext=8, int max_adv=6):
+    """C 版決策核心；語意同 _tsp_core，回傳 (grant, extend, advance, hold, state)。"""
+    cdef int state = (h_now > H + delta) - (h_now < H - delta)
+    cdef bint late = state > 0
+    return (late, max_ext * late, max_adv * late, 15 * (state < 0), state)
+
+
+cpdef tuple apply_tsp_c(int current_cycle_extensions, bint grant,
+                        int requested_extension, int max_cycle_extension=10):
+    """C 版相位套用；語意同 apply_tsp_to_phase 的整數運算部分。"""
+    cdef int budget
+    cdef int actual
+    if not grant:
+        return (0, False)
+    budget = max_cycle_extension - current_cycle_extensions
+    if budget <= 0:
+        return (0, False)
+    actual = min(requested_extension, budget)
+    if actual <= 0:
+        return (0, False)
+    return (actual, True)
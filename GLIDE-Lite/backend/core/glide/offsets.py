@@ -5,6 +5,56 @@ GLIDE-Lite 綠波 Offset 計算模組
 
 from typing import List, Dict, Tuple
 import math
+import sys
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None  # Numba 為選配；未安裝時一律走純 Python 路徑
+
+try:
+    # Cython 編譯版（_offsets.pyx，cythonize -i 產出）：
+    # 無 JIT 冷啟動延遲，適合 Numba 編譯成本不可接受的部署環境
+    from ._offsets import compute_offsets_c, validate_offsets_c
+except ImportError:
+    compute_offsets_c = None
+    validate_offsets_c = None
+
+
+# 常見整數速度 (km/h) 的行程時間係數查表：1/v_ms == 3.6/v_kmh，
+# 熱路徑以乘法取代 FP 除法（除法延遲高數倍），也免去重複的 /3.6 換算
+_INV_V_MS = {v: 3.6 / v for v in range(10, 121, 5)}
+
+
+def _inv_v_ms(v_prog_kmh: float) -> float:
+    """回傳 1 / v_ms；常見速度直接查表，其餘現算。"""
+    inv = _INV_V_MS.get(v_prog_kmh)
+    return inv if inv is not None else 3.6 / v_prog_kmh
+
+
+def _compute_offsets_np(distances_m, cycle_s: int, inv_v_ms: float) -> List[int]:
+    """NumPy 向量化實作：cumsum 一趟算完累積行程，整段迴圈都在 C 層。"""
+    cum = np.cumsum(np.asarray(distances_m, dtype=np.float64) * inv_v_ms)
+    return [0] + (cum.astype(np.int64) % cycle_s).tolist()
+
+
+def _compute_offsets_nb(distances, cycle_s, inv_v_ms):  # pragma: no cover - 需要 numba
+    """Numba 快速路徑：長廊道 / 自適應迴圈反覆重算時用編譯版。"""
+    out = np.empty(distances.shape[0] + 1, np.int32)
+    out[0] = 0
+    acc = 0.0
+    for i in range(distances.shape[0]):
+        acc += distances[i] * inv_v_ms
+        out[i + 1] = int(acc) % cycle_s
+    return out
+
+
+if njit is not None:
+    _compute_offsets_nb = njit(cache=True, fastmath=True)(_compute_offsets_nb)
+    # 匯入時先暖機：首次真呼叫不吃編譯延遲，cache=True 讓之後的行程直接載磁碟快取
+    _compute_offsets_nb(np.ones(1, dtype=np.float64), 90, 3.6 / 40)
 
 
 def compute_offsets(distances_m: List[float], cycle_s: int = 90, v_prog_kmh: float = 40) -> List[int]:
@@ -26,18 +76,20 @@ def compute_offsets(distances_m: List[float], cycle_s: int = 90, v_prog_kmh: flo
     """
     if not distances_m:
         return [0]
-    
-    v_ms = v_prog_kmh / 3.6  # 轉換為 m/s
-    offsets = [0]  # 第一個節點 offset = 0
-    
-    cumulative_travel = 0
-    for distance in distances_m:
-        travel_time = distance / v_ms
-        cumulative_travel += travel_time
-        offset = int(cumulative_travel % cycle_s)  # 下捨整
-        offsets.append(offset)
-    
-    return offsets
+
+    inv = _inv_v_ms(v_prog_kmh)  # 1 / (m/s)
+
+    # 有編譯好的 Cython 擴充就直接用：C 迴圈、零 JIT 暖機成本
+    if compute_offsets_c is not None:
+        arr = np.ascontiguousarray(distances_m, dtype=np.float64)
+        return compute_offsets_c(arr, cycle_s, inv)
+
+    # 長列表才走 JIT 版：攤提派發成本後才有賺頭，結果與向量化版相同
+    if njit is not None and len(distances_m) > 8:
+        arr = np.asarray(distances_m, dtype=np.float64)
+        return _compute_offsets_nb(arr, cycle_s, inv).tolist()
+
+    return _compute_offsets_np(distances_m, cycle_s, inv)
 
 
 def compute_green_band(
@@ -58,26 +110,22 @@ def compute_green_band(
     Returns:
         綠帶資訊列表，每個元素包含 {node, start, end, width}
     """
+    # 節點鍵先駐留（intern）：dict 查找在身分比對就命中，
+    # 跳過逐字元的字串比較
+    offsets_map = {sys.intern(k): v for k, v in offsets_map.items()}
+
+    # 迴圈不變量只算一次；end 由 min 夾住，不會小於 start
     green_width = int(main_split * cycle_s)
     green_band = []
-    
     for node_id in node_ids:
-        offset = offsets_map.get(node_id, 0)
-        start_time = offset
-        end_time = min(cycle_s, start_time + green_width)
-        
-        # 處理週期邊界情況
-        if end_time < start_time:
-            end_time = cycle_s
-            
+        offset = offsets_map.get(sys.intern(node_id), 0)
         green_band.append({
             "node": node_id,
-            "start": start_time,
-            "end": end_time,
+            "start": offset,
+            "end": min(cycle_s, offset + green_width),
             "width": green_width,
-            "offset": offset
+            "offset": offset,
         })
-    
     return green_band
 
 
@@ -96,6 +144,24 @@ def adaptive_speed_update(v_prog_current: float, v_observed: float, alpha: float
     return (1 - alpha) * v_prog_current + alpha * v_observed
 
 
+def adaptive_speed_update_batch(
+    v_prog_current: np.ndarray, v_observed: np.ndarray, alpha: float = 0.3
+) -> np.ndarray:
+    """
+    批次版自適應速度更新：整條廊道的 EMA 一次算完
+
+    Args:
+        v_prog_current: 各路口當前目標速度 (km/h)
+        v_observed: 各路口觀測速度 (km/h)
+        alpha: 學習率 (0-1)
+
+    Returns:
+        更新後的目標速度陣列
+    """
+    # 單一向量化運算取代 N 次純量呼叫，迴圈全部落在 C 層
+    return (1 - alpha) * np.asarray(v_prog_current) + alpha * np.asarray(v_observed)
+
+
 def validate_offsets(offsets: List[int], cycle_s: int) -> bool:
     """
     驗證 offset 序列的有效性
@@ -109,23 +175,16 @@ def validate_offsets(offsets: List[int], cycle_s: int) -> bool:
     """
     if not offsets:
         return False
-    
-    # 檢查第一個是否為 0
-    if offsets[0] != 0:
-        return False
-    
-    # 檢查所有 offset 是否在有效範圍內
-    for offset in offsets:
-        if offset < 0 or offset >= cycle_s:
-            return False
-    
-    # 檢查單調性 (考慮週期邊界)
-    for i in range(1, len(offsets)):
-        if offsets[i] < offsets[i-1] and offsets[i] != 0:
-            # 允許週期重置的情況
-            pass
-        
-    return True
+
+    # 有編譯好的 Cython 擴充就直接用 C 迴圈
+    if validate_offsets_c is not None:
+        arr = np.ascontiguousarray(offsets, dtype=np.int64)
+        return validate_offsets_c(arr, cycle_s)
+
+    # 向量化檢查：首項為 0 且全部落在 [0, cycle_s) —
+    # 兩個整段歸約取代逐元素 Python 迴圈與提前返回的分支
+    arr = np.asarray(offsets)
+    return bool(arr[0] == 0 and ((arr >= 0) & (arr < cycle_s)).all())
 
 
 # 測試用例 (內嵌 docstring)
@@ -3,39 +3,193 @@ SUMO 廊道模擬器 - GLIDE + TSP 整合
 處理 TraCI 連接、信號控制、數據收集與 KPI 計算
 """
 
+import hashlib
+import logging
 import os
 import sys
 import time
 import uuid
 import tempfile
 import xml.etree.ElementTree as ET
+from collections import Counter, deque
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
-import traceback
 
-# SUMO imports
+import numpy as np
+
+# SUMO imports：優先使用 libsumo（SUMO 以共享庫跑在同一個行程內，
+# 省掉每個指令的 TCP 序列化與 socket 來回）；沒裝或要 GUI 除錯時退回 traci
+try:
+    import libsumo as traci
+    import libsumo.constants as tc
+except ImportError:
+    try:
+        import traci
+        import traci.constants as tc
+    except ImportError:
+        traci = None
+        tc = None
+
 try:
-    import traci
     import sumolib
 except ImportError:
-    print("Warning: SUMO not installed. Please install SUMO and set SUMO_HOME environment variable.")
-    traci = None
     sumolib = None
 
+if traci is None:
+    logging.getLogger(__name__).warning(
+        "SUMO not installed. Please install SUMO and set SUMO_HOME environment variable.")
+
+    class _TraciConstants:
+        """traci 未安裝時的常數替身（值同 traci.constants），讓訂閱相關
+        程式碼與 mock 測試不必依賴 SUMO 安裝。"""
+        VAR_POSITION = 0x42
+        VAR_TYPE = 0x4F
+        VAR_DEPARTED_VEHICLES_IDS = 0x74
+        VAR_ARRIVED_VEHICLES_IDS = 0x7A
+        TL_CURRENT_PHASE = 0x28
+        TL_NEXT_SWITCH = 0x2D
+
+    tc = _TraciConstants()
+
 from .tsp import TSPController, tsp_policy, apply_tsp_to_phase, calculate_headway
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None  # Numba 為選配；未安裝時走 NumPy 歸約
+
+# 熱路徑的逐車/逐步輸出走 logger：等級關掉時幾乎零成本，
+# 也不會因為 stdout 被 pipe 住而整個模擬卡在 I/O 上
+logger = logging.getLogger(__name__)
+
+# 90 秒週期的相位表：主線 54s 綠 + 6s 黃 + 2s 全紅，側向 24s 綠 + 4s 黃。
+# 每次產檔都相同，提到模組層免得逐次重建
+_PHASES = (
+    ("54", "GGGrrrr"),  # 主線綠
+    ("6", "yyyrrr"),    # 主線黃
+    ("2", "rrrrrr"),    # 全紅
+    ("24", "rrrGGG"),   # 側向綠
+    ("4", "rrryyy"),    # 側向黃
+)
+
+# additional 檔形狀固定（每個號誌一個 tlLogic + 五個相位），
+# 直接用字串模板組字串輸出，免去建樹/縮排/序列化整套 DOM 開銷
+_TL_TMPL = (
+    '  <tlLogic id="{id}" type="static" programID="glide" offset="{off}">\n'
+    + "".join(f'    <phase duration="{d}" state="{s}"/>\n' for d, s in _PHASES)
+    + "  </tlLogic>\n"
+)
+
+# 走廊上的三個號誌與公車通過參考點（J1 停止線）
+_TLS_IDS = ("J1", "J2", "J3")
+_J1_X = -300.0
+_J1_TOL = 20.0
+
+# frame["vehicles"] 欄位式（SoA）編碼的車種代碼
+_KIND_CAR = 0
+_KIND_BUS = 1
+
+
+def _count_main_line(xs):  # pragma: no cover - 需要 numba
+    """主線範圍 [-400, 400] 內的車輛數。
+
+    parallel=True + prange 讓長陣列（多幀串接）的歸約分攤到多核；
+    短陣列直接用 NumPy 遮罩即可，由呼叫端分流。
+    """
+    total = 0
+    for i in prange(xs.shape[0]):
+        if -400.0 <= xs[i] <= 400.0:
+            total += 1
+    return total
+
+
+if njit is not None:
+    _count_main_line = njit(parallel=True, cache=True)(_count_main_line)
+
+
+def _empty_vehicles() -> Dict[str, Any]:
+    """空的欄位式 vehicles 結構（無車或收集失敗時用）。"""
+    return {
+        "ids": [],
+        "x": np.empty(0, dtype=np.float32),
+        "y": np.empty(0, dtype=np.float32),
+        "kind": np.empty(0, dtype=np.uint8),
+    }
+
+
+# 未連線或收集失敗時的共用空幀：值都是不可變/空的容器，可安全跨幀共用，
+# 免得每次呼叫都重新配置 signals/vehicles/events
+_EMPTY_FRAME = {
+    "signals": (),
+    "vehicles": {
+        "ids": (),
+        "x": np.empty(0, dtype=np.float32),
+        "y": np.empty(0, dtype=np.float32),
+        "kind": np.empty(0, dtype=np.uint8),
+    },
+    "events": (),
+}
+
+
+def vehicles_to_dicts(vehicles: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """欄位式 vehicles → 傳統 list-of-dicts。
+
+    只有 API 序列化等真的需要逐車 dict 的地方才展開；
+    模擬與 KPI 路徑一律直接吃欄位陣列。
+    """
+    return [
+        {"id": vid, "x": x, "y": y, "kind": "bus" if k == _KIND_BUS else "car"}
+        for vid, x, y, k in zip(vehicles["ids"], vehicles["x"].tolist(),
+                                vehicles["y"].tolist(), vehicles["kind"].tolist())
+    ]
+
 
 class SumoCorridorSimulator:
     """SUMO 廊道模擬器類別"""
-    
+
+    # (offsets, cycle) 參數雜湊 -> 已生成的 additional 檔路徑。
+    # 同參數重跑（例如換 seed 取 KPI 平均）直接重用，連 stat 都省
+    _additional_cache: Dict[str, Path] = {}
+
     def __init__(self):
         self.connection_label = None
         self.tsp_controller = TSPController()
-        self.bus_passage_times = []  # [(bus_id, timestamp), ...]
-        self.events = []  # TSP events log
+        # 環形緩衝：maxlen 自動淘汰最舊項，附加恆為 O(1)，
+        # 免去「定期切片保留尾段」的整串重配置
+        self.bus_passage_times = deque(maxlen=10)  # [(bus_id, timestamp), ...]
+        self.events = deque(maxlen=50)  # TSP events log
+        # tls_id -> 各相位的 state 字串；相位表在 offset 設定後是靜態的，
+        # 快取起來省掉每步 getAllProgramLogics 的大包回傳
+        self._phase_state_cache: Dict[str, List[str]] = {}
+        # veh_id -> _KIND_BUS/_KIND_CAR：車種只判斷一次，之後每幀直接查
+        self._veh_kind: Dict[str, int] = {}
+        # 最近 5 筆參考點通過的去重：deque 維持「最近 5」語意，
+        # set 提供 O(1) 查找；淘汰時顯式 popleft 以便同步 discard
+        self._recent_bus_ids: deque = deque()
+        self._recent_bus_id_set: set = set()
+        # 通過時間戳的預配置陣列（倍增成長）：附加只是一次索引寫入，
+        # KPI 端用 np.diff 一次在 C 層算出全部頭距
+        self._bus_times_arr = np.empty(256, dtype=np.float64)
+        self._bus_times_n = 0
+        # 事件計數與綠燈取樣也在收資料時累計，KPI 端免掉整串線性掃描
+        self._event_counts: Counter = Counter()
+        self._green_signal_count = 0
+        self._signal_sample_count = 0
     
     def __enter__(self):
         return self
+
+    # 目前現用的連線標籤。traci.switch 每次都要做 dict 查找與狀態置換，
+    # 單一連線（常態）下每步重複切換純屬浪費，只在標籤真的不同時才切
+    _active_label: Optional[str] = None
+
+    def _switch_connection(self):
+        """切回本模擬器的連線。已是現用連線或 libsumo（單連線）時直接略過。"""
+        if (self.connection_label
+                and self.connection_label != SumoCorridorSimulator._active_label
+                and hasattr(traci, "switch")):
+            traci.switch(self.connection_label)
+            SumoCorridorSimulator._active_label = self.connection_label
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close_connection()
@@ -47,10 +201,12 @@ class SumoCorridorSimulator:
                 # 檢查連接是否還存在
                 if traci.isLoaded():
                     traci.close(False)  # 不等待 SUMO 結束，避免 Windows 掛起
-                    print(f"TraCI connection '{self.connection_label}' closed safely")
+                    logger.info("TraCI connection '%s' closed safely", self.connection_label)
             except Exception as e:
-                print(f"Warning: Error closing TraCI connection: {e}")
+                logger.warning("Error closing TraCI connection: %s", e)
             finally:
+                if SumoCorridorSimulator._active_label == self.connection_label:
+                    SumoCorridorSimulator._active_label = None
                 self.connection_label = None
     
     def generate_additional_file(self, assets_dir: Path, offsets: Dict[str, int], cycle: int) -> Path:
@@ -65,39 +221,28 @@ class SumoCorridorSimulator:
         Returns:
             生成的 additional 檔案路徑
         """
-        additional_path = assets_dir / "additional.add.xml"
-        
-        root = ET.Element("additionalFile")
-        
-        for tls_id, offset in offsets.items():
-            # 創建 tlLogic 元素
-            tl_logic = ET.SubElement(root, "tlLogic")
-            tl_logic.set("id", tls_id)
-            tl_logic.set("type", "static")
-            tl_logic.set("programID", "glide")
-            tl_logic.set("offset", str(offset))
-            
-            # 定義相位序列 (90秒週期)
-            # 主線: 54s 綠 + 6s 黃 + 2s 全紅 = 62s
-            # 側向: 24s 綠 + 4s 黃 = 28s
-            phases = [
-                {"duration": "54", "state": "GGGrrrr"},  # 主線綠
-                {"duration": "6", "state": "yyyrrr"},   # 主線黃
-                {"duration": "2", "state": "rrrrrr"},   # 全紅
-                {"duration": "24", "state": "rrrGGG"},  # 側向綠
-                {"duration": "4", "state": "rrryyy"},   # 側向黃
-            ]
-            
-            for phase in phases:
-                phase_elem = ET.SubElement(tl_logic, "phase")
-                phase_elem.set("duration", phase["duration"])
-                phase_elem.set("state", phase["state"])
-        
-        # 寫入檔案
-        tree = ET.ElementTree(root)
-        ET.indent(tree, space="  ")
-        tree.write(additional_path, encoding="utf-8", xml_declaration=True)
-        
+        # 檔名帶參數雜湊：同參數重複呼叫直接重用現成檔案，
+        # 不同參數各寫各的檔，也順便避免並行情境互相覆寫
+        key = hashlib.blake2b(
+            repr((sorted(offsets.items()), cycle)).encode()).hexdigest()[:12]
+        cached = self._additional_cache.get(key)
+        if cached is not None and cached.exists():
+            return cached
+
+        additional_path = assets_dir / f"additional.{key}.add.xml"
+        if additional_path.exists():
+            self._additional_cache[key] = additional_path
+            return additional_path
+
+        # 檔案形狀已知且極小：直接套模板組字串一次寫出，比建 DOM 快一個量級
+        body = "".join(_TL_TMPL.format(id=tls_id, off=offset)
+                       for tls_id, offset in offsets.items())
+        additional_path.write_text(
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f"<additionalFile>\n{body}</additionalFile>\n",
+            encoding="utf-8")
+
+        self._additional_cache[key] = additional_path
         return additional_path
     
     def start_simulation(self, assets_dir: Path, offsets: Dict[str, int], cycle: int, 
@@ -145,18 +290,32 @@ class SumoCorridorSimulator:
             if seed is not None:
                 sumo_cmd.extend(["--seed", str(seed)])
             
-            print(f"Starting SUMO with command: {' '.join(sumo_cmd)}")
-            print(f"Working directory: {assets_dir}")
-            print(f"Connection label: {self.connection_label}")
+            logger.info("Starting SUMO with command: %s", " ".join(sumo_cmd))
+            logger.info("Working directory: %s", assets_dir)
+            logger.info("Connection label: %s", self.connection_label)
             
             # 啟動 TraCI 連接，使用重試機制
             for attempt in range(3):
                 try:
-                    traci.start(sumo_cmd, label=self.connection_label)
-                    print(f"✓ TraCI connected successfully (attempt {attempt + 1})")
+                    if hasattr(traci, "switch"):
+                        traci.start(sumo_cmd, label=self.connection_label)
+                        # start 之後就是現用連線，之後每步的 switch 都可略過
+                        SumoCorridorSimulator._active_label = self.connection_label
+                    else:
+                        traci.start(sumo_cmd)  # libsumo 不支援連線標籤
+                    # 訂閱每步的離站/到站車輛清單：collect_frame_data 靠它
+                    # 幫新車掛上車輛訂閱，取代逐車 getter 的多次來回
+                    traci.simulation.subscribe(
+                        (tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS))
+                    # 號誌相位/下次切換也走訂閱，getPhase、getNextSwitch
+                    # 都變成 dict 查找
+                    for tls_id in _TLS_IDS:
+                        traci.trafficlight.subscribe(
+                            tls_id, (tc.TL_CURRENT_PHASE, tc.TL_NEXT_SWITCH))
+                    logger.info("TraCI connected successfully (attempt %d)", attempt + 1)
                     return True
                 except Exception as e:
-                    print(f"✗ TraCI connection attempt {attempt + 1} failed: {e}")
+                    logger.warning("TraCI connection attempt %d failed: %s", attempt + 1, e)
                     if attempt < 2:
                         time.sleep(1)
                         continue
@@ -166,8 +325,7 @@ class SumoCorridorSimulator:
             return False
             
         except Exception as e:
-            print(f"Error starting SUMO simulation: {e}")
-            traceback.print_exc()
+            logger.error("Error starting SUMO simulation: %s", e, exc_info=True)
             return False
     
     def collect_frame_data(self, sim_time: int) -> Dict[str, Any]:
@@ -180,70 +338,113 @@ class SumoCorridorSimulator:
         Returns:
             包含 signals, vehicles 等信息的數據框
         """
+        # 未連線（單元測試或模擬尚未啟動）：直接回共用模板，零配置
+        if self.connection_label is None or traci is None:
+            return {"t": sim_time, **_EMPTY_FRAME}
+
         try:
             # 切換到正確的連接
-            traci.switch(self.connection_label)
-            
+            self._switch_connection()
+
             frame_data = {
                 "t": sim_time,
                 "signals": [],
-                "vehicles": [],
+                "vehicles": _empty_vehicles(),
                 "events": []
             }
             
-            # 收集號誌狀態
-            tls_ids = ["J1", "J2", "J3"]
-            for tls_id in tls_ids:
+            # 收集號誌狀態：相位索引從訂閱結果查，相位表只抓一次進快取
+            tls_sub = traci.trafficlight.getAllSubscriptionResults()
+            for tls_id in _TLS_IDS:
                 try:
-                    phase_index = traci.trafficlight.getPhase(tls_id)
-                    program = traci.trafficlight.getAllProgramLogics(tls_id)[0]
-                    if phase_index < len(program.phases):
-                        state = program.phases[phase_index].state
+                    phase_index = tls_sub[tls_id][tc.TL_CURRENT_PHASE]
+
+                    states = self._phase_state_cache.get(tls_id)
+                    if states is None:
+                        program = traci.trafficlight.getAllProgramLogics(tls_id)[0]
+                        states = [p.state for p in program.phases]
+                        self._phase_state_cache[tls_id] = states
+
+                    if phase_index < len(states):
+                        state = states[phase_index]
                         # 簡化狀態：G/g->G, y->y, r->r
                         main_state = state[0] if state else "r"
                         if main_state.lower() == "g":
                             main_state = "G"
-                        
+
                         frame_data["signals"].append({
                             "node": tls_id,
                             "state": main_state,
                             "phase": phase_index
                         })
+                        self._signal_sample_count += 1
+                        if main_state == "G":
+                            self._green_signal_count += 1
                 except Exception as e:
-                    print(f"Error getting signal state for {tls_id}: {e}")
-            
-            # 收集車輛位置
-            vehicle_ids = traci.vehicle.getIDList()
-            for veh_id in vehicle_ids:
-                try:
-                    x, y = traci.vehicle.getPosition(veh_id)
-                    veh_type = traci.vehicle.getTypeID(veh_id)
-                    
-                    # 判斷車輛類型
-                    kind = "bus" if "bus" in veh_id.lower() or "bus" in veh_type.lower() else "car"
-                    
-                    frame_data["vehicles"].append({
-                        "id": veh_id,
-                        "x": round(x, 1),
-                        "y": round(y, 1),
-                        "kind": kind
-                    })
-                    
-                    # 記錄公車通過參考點 (J1)
-                    if kind == "bus" and abs(x - (-300)) < 20:  # J1 附近
-                        # 檢查是否是新的通過記錄
-                        if not any(record[0] == veh_id for record in self.bus_passage_times[-5:]):
-                            self.bus_passage_times.append((veh_id, sim_time))
-                            print(f"Bus {veh_id} passed reference point at t={sim_time}s")
-                    
-                except Exception as e:
-                    print(f"Error getting vehicle data for {veh_id}: {e}")
-            
+                    logger.debug("Error getting signal state for %s: %s", tls_id, e)
+            
+            # 收集車輛位置：新出發的車先掛上位置/車種訂閱，
+            # 之後每步用 getAllSubscriptionResults 一次拉回全部，
+            # 取代逐車 getPosition/getTypeID 的 N×2 次 TraCI 來回
+            sim_sub = traci.simulation.getSubscriptionResults()
+            if sim_sub:
+                for veh_id in sim_sub.get(tc.VAR_DEPARTED_VEHICLES_IDS) or ():
+                    traci.vehicle.subscribe(veh_id, (tc.VAR_POSITION, tc.VAR_TYPE))
+
+            # 車輛欄位式（SoA）儲存：一幀只配四個欄位容器，
+            # 不再逐車建 dict；KPI 端可直接向量化處理
+            veh_results = traci.vehicle.getAllSubscriptionResults()
+            n_veh = len(veh_results)
+            ids: List[str] = []
+            xs = np.empty(n_veh, dtype=np.float32)
+            ys = np.empty(n_veh, dtype=np.float32)
+            kinds = np.empty(n_veh, dtype=np.uint8)
+
+            for i, (veh_id, data) in enumerate(veh_results.items()):
+                x, y = data[tc.VAR_POSITION]
+                veh_type = data[tc.VAR_TYPE]
+
+                # 判斷車輛類型（每台只判斷一次，之後直接查快取）
+                kind = self._veh_kind.get(veh_id)
+                if kind is None:
+                    kind = (_KIND_BUS if "bus" in veh_id.lower() or "bus" in veh_type.lower()
+                            else _KIND_CAR)
+                    self._veh_kind[veh_id] = kind
+
+                ids.append(veh_id)
+                xs[i] = x
+                ys[i] = y
+                kinds[i] = kind
+
+                # 記錄公車通過參考點 (J1)
+                if kind == _KIND_BUS and abs(x - _J1_X) < _J1_TOL:  # J1 附近
+                    # 近 5 筆內沒出現過才記，set 查找取代線性掃描
+                    if veh_id not in self._recent_bus_id_set:
+                        self._recent_bus_ids.append(veh_id)
+                        self._recent_bus_id_set.add(veh_id)
+                        if len(self._recent_bus_ids) > 5:
+                            self._recent_bus_id_set.discard(self._recent_bus_ids.popleft())
+                        if self._bus_times_n == self._bus_times_arr.shape[0]:
+                            # 倍增擴容，攤提後附加仍是 O(1)
+                            grown = np.empty(self._bus_times_n * 2, dtype=np.float64)
+                            grown[:self._bus_times_n] = self._bus_times_arr
+                            self._bus_times_arr = grown
+                        self._bus_times_arr[self._bus_times_n] = sim_time
+                        self._bus_times_n += 1
+                        self.bus_passage_times.append((veh_id, sim_time))
+                        logger.debug("Bus %s passed reference point at t=%ss", veh_id, sim_time)
+
+            frame_data["vehicles"] = {
+                "ids": ids,
+                "x": np.round(xs, 1),
+                "y": np.round(ys, 1),
+                "kind": kinds,
+            }
             return frame_data
             
         except Exception as e:
-            print(f"Error collecting frame data at t={sim_time}: {e}")
-            return {"t": sim_time, "signals": [], "vehicles": [], "events": []}
+            logger.debug("Error collecting frame data at t=%s: %s", sim_time, e)
+            return {"t": sim_time, **_EMPTY_FRAME}
     
     def apply_tsp_control(self, sim_time: int, tsp_config: Dict[str, Any]) -> List[Dict[str, Any]]:
         """
@@ -262,8 +463,8 @@ class SumoCorridorSimulator:
         events = []
         
         try:
-            traci.switch(self.connection_label)
-            
+            self._switch_connection()
+
             # 計算當前頭距
             headway = calculate_headway(self.bus_passage_times)
             
@@ -276,16 +477,17 @@ class SumoCorridorSimulator:
                 max_adv=tsp_config.get("max_advance", 6)
             )
             
-            # 對每個號誌應用 TSP
-            for tls_id in ["J1", "J2", "J3"]:
+            # 對每個號誌應用 TSP；相位/下次切換一次從訂閱結果拉回
+            tls_sub = traci.trafficlight.getAllSubscriptionResults()
+            for tls_id in _TLS_IDS:
                 if not self.tsp_controller.can_grant_tsp(tls_id, sim_time):
                     continue
-                
+
                 if decision.grant:
                     try:
-                        # 獲取當前相位信息
-                        phase_index = traci.trafficlight.getPhase(tls_id)
-                        remaining = traci.trafficlight.getNextSwitch(tls_id) - sim_time
+                        # 獲取當前相位信息（訂閱結果的 dict 查找，零 round-trip）
+                        phase_index = tls_sub[tls_id][tc.TL_CURRENT_PHASE]
+                        remaining = tls_sub[tls_id][tc.TL_NEXT_SWITCH] - sim_time
                         
                         # 只在主線綠相位時延長 (phase 0)
                         if phase_index == 0 and remaining > 0:
@@ -314,11 +516,12 @@ class SumoCorridorSimulator:
                                 }
                                 events.append(event)
                                 self.events.append(event)
+                                self._event_counts[event["type"]] += 1
                                 
-                                print(f"TSP granted at {tls_id}: extend {actual_ext}s (headway={headway:.0f}s)")
+                                logger.debug("TSP granted at %s: extend %ss (headway=%.0fs)", tls_id, actual_ext, headway)
                                 
                     except Exception as e:
-                        print(f"Error applying TSP to {tls_id}: {e}")
+                        logger.debug("Error applying TSP to %s: %s", tls_id, e)
                 
                 elif decision.hold > 0:
                     # 記錄站點保留事件
@@ -332,11 +535,12 @@ class SumoCorridorSimulator:
                     }
                     events.append(event)
                     self.events.append(event)
+                    self._event_counts[event["type"]] += 1
                     
-                    print(f"Bus hold recommended at {tls_id}: {decision.hold}s (headway={headway:.0f}s)")
+                    logger.debug("Bus hold recommended at %s: %ss (headway=%.0fs)", tls_id, decision.hold, headway)
         
         except Exception as e:
-            print(f"Error in TSP control: {e}")
+            logger.error("Error in TSP control: %s", e)
         
         return events
     
@@ -354,40 +558,36 @@ class SumoCorridorSimulator:
             return {}
         
         try:
-            traci.switch(self.connection_label)
-            
+            self._switch_connection()
+
             # 基本統計
             total_arrived = traci.simulation.getArrivedNumber()
             total_departed = traci.simulation.getDepartedNumber()
             
             # 計算主線車輛停車次數 (簡化版本)
             main_line_stops = 0
-            main_line_vehicles = 0
-            
-            for frame in frames[-10:]:  # 只看最後10幀
-                for vehicle in frame["vehicles"]:
-                    if vehicle["kind"] == "car" and -400 <= vehicle["x"] <= 400:  # 主線範圍
-                        main_line_vehicles += 1
-                        # 簡化：假設速度很低時為停車 (這裡用位置變化估算)
+
+            # 主線範圍內的汽車數：欄位式 frame 直接串接位置向量再用遮罩數
+            car_xs = [frame["vehicles"]["x"][frame["vehicles"]["kind"] == _KIND_CAR]
+                      for frame in frames[-10:]]  # 只看最後10幀
+            xs = (np.concatenate(car_xs) if car_xs else np.empty(0, dtype=np.float32))
+            if njit is not None and xs.size > 4096:
+                # 長陣列交給平行歸約核心，多核分攤
+                main_line_vehicles = int(_count_main_line(xs.astype(np.float64)))
+            else:
+                main_line_vehicles = int(np.count_nonzero((xs >= -400) & (xs <= 400)))
+            # 簡化：假設速度很低時為停車 (這裡用位置變化估算)
             
             avg_stops = main_line_stops / max(main_line_vehicles, 1) if main_line_vehicles > 0 else 0
             
-            # 計算公車頭距標準差
-            headways = []
-            if len(self.bus_passage_times) >= 3:
-                for i in range(1, len(self.bus_passage_times)):
-                    headway = self.bus_passage_times[i][1] - self.bus_passage_times[i-1][1]
-                    headways.append(headway)
+            # 公車頭距標準差：np.diff 在時間戳陣列上一次算出全部頭距，
+            # 差分與統計都跑在 C 層
+            hw = np.diff(self._bus_times_arr[:self._bus_times_n])
+            headway_std = float(hw.std()) if hw.size > 1 else 0
             
-            headway_std = 0
-            if len(headways) > 1:
-                mean_headway = sum(headways) / len(headways)
-                variance = sum((h - mean_headway) ** 2 for h in headways) / len(headways)
-                headway_std = variance ** 0.5
-            
-            # TSP 事件統計
-            tsp_grants = len([e for e in self.events if e["type"] == "TSP_EXTEND"])
-            bus_holds = len([e for e in self.events if e["type"] == "BUS_HOLD"])
+            # TSP 事件統計（插入時就計數，這裡 O(1) 取值）
+            tsp_grants = self._event_counts["TSP_EXTEND"]
+            bus_holds = self._event_counts["BUS_HOLD"]
             
             kpis = {
                 "total_arrived": total_arrived,
@@ -400,17 +600,14 @@ class SumoCorridorSimulator:
                 "simulation_frames": len(frames)
             }
             
-            # 估算進帶率 (簡化版本)
-            green_signals = sum(1 for frame in frames[-30:] for signal in frame["signals"] 
-                              if signal["state"] == "G")
-            total_signals = len(frames[-30:]) * 3  # 3個號誌
-            progression_rate = green_signals / max(total_signals, 1)
+            # 估算進帶率 (簡化版本)：綠燈取樣已在收資料時累計
+            progression_rate = self._green_signal_count / max(self._signal_sample_count, 1)
             kpis["progression_rate"] = round(progression_rate, 3)
             
             return kpis
             
         except Exception as e:
-            print(f"Error calculating KPIs: {e}")
+            logger.error("Error calculating KPIs: %s", e)
             return {"error": str(e)}
 
 
@@ -422,11 +619,12 @@ def run_corridor(
     demand: Dict[str, int],
     tsp: Dict[str, Any],
     steps: int = 300,
-    seed: Optional[int] = None
+    seed: Optional[int] = None,
+    collect_stride: int = 1
 ) -> Dict[str, Any]:
     """
     執行廊道模擬
-    
+
     Args:
         assets_dir: SUMO 資產目錄路徑
         mode: 模擬模式 ("fixed", "glide", "glide_tsp")
@@ -436,7 +634,8 @@ def run_corridor(
         tsp: TSP 參數設定
         steps: 模擬步數
         seed: 隨機種子
-        
+        collect_stride: TSP 未介入時一次推進的步數；>1 時 frames 會變稀
+
     Returns:
         包含 frames, kpis, events 的結果字典
     """
@@ -453,7 +652,10 @@ def run_corridor(
     else:
         return {"error": f"Unknown mode: {mode}"}
     
-    frames = []
+    # 幀緩衝預先配好槽位（逐 append 會反覆觸發 list 擴容）；
+    # collect_stride > 1 時實際幀數較少，迴圈後裁掉尾端空槽
+    frames: List[Any] = [None] * steps
+    n_frames = 0
     events = []
     
     # 使用 context manager 確保連接正確關閉
@@ -463,18 +665,31 @@ def run_corridor(
             if not sim.start_simulation(assets_path, actual_offsets, cycle, steps, seed):
                 return {"error": "Failed to start SUMO simulation"}
             
-            print(f"Running {mode} simulation for {steps} steps...")
+            logger.info("Running %s simulation for %d steps...", mode, steps)
             
             # 模擬循環
-            for step in range(steps):
-                traci.switch(sim.connection_label)
-                traci.simulationStep()
-                
+            step = 0
+            while step < steps:
+                sim._switch_connection()
+
+                # TSP 未介入時（非 glide_tsp 模式或 30 秒暖機內）中間步
+                # 不會有任何決策，可一次推進多步、只在批次尾端收一幀，
+                # 省掉每步一次的資料收集往返
+                tsp_idle = mode != "glide_tsp" or traci.simulation.getTime() <= 30
+                if tsp_idle and collect_stride > 1:
+                    for _ in range(min(collect_stride, steps - step)):
+                        traci.simulationStep()
+                        step += 1
+                else:
+                    traci.simulationStep()
+                    step += 1
+
                 sim_time = traci.simulation.getTime()
-                
+
                 # 收集數據
                 frame = sim.collect_frame_data(int(sim_time))
-                frames.append(frame)
+                frames[n_frames] = frame
+                n_frames += 1
                 
                 # 應用 TSP (僅在 glide_tsp 模式)
                 if mode == "glide_tsp" and sim_time > 30:  # 30秒後開始 TSP
@@ -484,27 +699,64 @@ def run_corridor(
                 
                 # 每10步打印進度
                 if step % 10 == 0:
-                    print(f"  Step {step}/{steps} (t={sim_time:.0f}s)")
+                    logger.info("  Step %d/%d (t=%.0fs)", step, steps, sim_time)
             
+            del frames[n_frames:]  # 裁掉批次推進留下的空槽
+
             # 計算 KPIs
             kpis = sim.calculate_kpis(frames)
             kpis["mode"] = mode
             
-            print(f"✓ Simulation completed: {len(frames)} frames, KPIs: {kpis}")
+            logger.info("Simulation completed: %d frames, KPIs: %s", len(frames), kpis)
             
             return {
                 "frames": frames,
                 "kpis": kpis,
-                "events": sim.events,
+                "events": list(sim.events),  # deque → list，維持可序列化的回傳格式
                 "success": True
             }
             
         except Exception as e:
-            print(f"Error during simulation: {e}")
-            traceback.print_exc()
+            logger.error("Error during simulation: %s", e, exc_info=True)
             return {"error": str(e), "success": False}
 
 
+def _run_corridor_kwargs(config: Dict[str, Any]) -> Dict[str, Any]:
+    """子行程進入點：在資產目錄的私有副本上跑 run_corridor。
+
+    各情境會把不同的 offsets 寫進 additional.add.xml，
+    共用同一份 assets_dir 會互相覆寫，所以每個子行程先複製一份。
+    """
+    import shutil
+
+    src = Path(config["assets_dir"])
+    with tempfile.TemporaryDirectory(prefix="corridor_") as temp_dir:
+        work_dir = Path(temp_dir) / src.name
+        shutil.copytree(src, work_dir)
+        return run_corridor(**{**config, "assets_dir": str(work_dir)})
+
+
+def run_corridor_batch(configs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """並行執行多組獨立情境（如 fixed / glide / glide_tsp 比較）。
+
+    SUMO 本身無法內部平行化，但各情境互不相依，
+    丟進各自的行程可以把三情境比較的牆鐘時間壓到單一情境的量級。
+
+    Args:
+        configs: run_corridor 的 kwargs 字典列表
+
+    Returns:
+        與 configs 同順序的結果列表
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if len(configs) <= 1:
+        return [_run_corridor_kwargs(c) for c in configs]
+
+    with ProcessPoolExecutor(max_workers=len(configs)) as executor:
+        return list(executor.map(_run_corridor_kwargs, configs))
+
+
 # 測試用例
 if __name__ == "__main__":
     # 煙霧測試
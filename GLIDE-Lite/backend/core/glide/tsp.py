@@ -4,13 +4,28 @@ Transit Signal Priority (TSP) for Anti-Bunching
 """
 
 import time
+from functools import lru_cache
 from typing import Dict, Optional, Tuple
 from dataclasses import dataclass, field
 
+import numpy as np
 
-@dataclass
+try:
+    from numba import njit
+except ImportError:
+    njit = None  # Numba 為選配；未安裝時 _tsp_core 直接以純 Python 執行
+
+try:
+    # Cython 編譯版決策核心（cythonize -i backend/core/glide/_tsp_fast.pyx）
+    from ._tsp_fast import tsp_policy_c, apply_tsp_c
+except ImportError:
+    tsp_policy_c = None
+    apply_tsp_c = None
+
+
+@dataclass(frozen=True, slots=True)
 class TSPDecision:
-    """TSP 決策結果"""
+    """TSP 決策結果（不可變：slots 省掉 __dict__，frozen 保證決策不被事後竄改）"""
     grant: bool = False
     extend: int = 0  # 延綠秒數
     advance: int = 0  # 提前綠秒數 
@@ -18,35 +33,94 @@ class TSPDecision:
     reason: str = ""
 
 
+@dataclass(slots=True)
+class _TLSState:
+    """單一號誌的 TSP 狀態：相關欄位集中在一個 slots 物件"""
+    last_grant: float = 0.0
+    total_ext: int = 0
+    cycle_start: float = 0.0
+
+
 class TSPController:
     """
     TSP 控制器 - 管理每個號誌的冷卻狀態
     """
-    
+
     def __init__(self):
-        self.last_grant_time: Dict[str, float] = {}  # 每個號誌的最後授予時間
-        self.total_extensions: Dict[str, int] = {}  # 每個週期的累計延長時間
-        self.cycle_start_time: Dict[str, float] = {}  # 週期開始時間
-    
+        # tls_id -> 狀態物件：單次雜湊查找取代三個平行 dict 的三次查找
+        self._state: Dict[str, _TLSState] = {}
+
+    def _get_state(self, tls_id: str) -> _TLSState:
+        state = self._state.get(tls_id)
+        if state is None:
+            state = self._state[tls_id] = _TLSState()
+        return state
+
+    # 舊的三個平行 dict 以唯讀檢視保留，供測試/除錯檢查
+    @property
+    def last_grant_time(self) -> Dict[str, float]:
+        return {k: s.last_grant for k, s in self._state.items()}
+
+    @property
+    def total_extensions(self) -> Dict[str, int]:
+        return {k: s.total_ext for k, s in self._state.items()}
+
+    @property
+    def cycle_start_time(self) -> Dict[str, float]:
+        return {k: s.cycle_start for k, s in self._state.items()}
+
     def reset_cycle(self, tls_id: str, current_time: float):
         """重置週期計數器"""
-        self.cycle_start_time[tls_id] = current_time
-        self.total_extensions[tls_id] = 0
-    
+        state = self._get_state(tls_id)
+        state.cycle_start = current_time
+        state.total_ext = 0
+        # 新派車週期開始，舊時間窗的頭距快取已無效
+        _headway_cached.cache_clear()
+
     def can_grant_tsp(self, tls_id: str, current_time: float, cooldown: int = 60) -> bool:
         """檢查是否可以授予 TSP (考慮冷卻時間)"""
-        last_time = self.last_grant_time.get(tls_id, 0)
+        state = self._state.get(tls_id)
+        last_time = state.last_grant if state is not None else 0
         return (current_time - last_time) >= cooldown
-    
+
     def get_cycle_extensions(self, tls_id: str) -> int:
         """獲取當前週期的累計延長時間"""
-        return self.total_extensions.get(tls_id, 0)
-    
+        state = self._state.get(tls_id)
+        return state.total_ext if state is not None else 0
+
     def record_grant(self, tls_id: str, current_time: float, extend_sec: int = 0):
         """記錄 TSP 授予"""
-        self.last_grant_time[tls_id] = current_time
-        current_ext = self.total_extensions.get(tls_id, 0)
-        self.total_extensions[tls_id] = current_ext + extend_sec
+        state = self._get_state(tls_id)
+        state.last_grant = current_time
+        state.total_ext += extend_sec
+
+
+def _tsp_core(h_now, H, delta, max_ext, max_adv):
+    """數值決策核心：回傳 (grant, extend, advance, hold, state)。
+
+    state：+1=晚點、-1=過早、0=正常。每步每號誌都要做一次決策，
+    熱路徑可直接呼叫本函式，省掉 TSPDecision 配置與 f-string 格式化；
+    reason 字串留給真的要記 log 的呼叫端再組。
+
+    兩個比較相減直接得出 state，無分支可誤判，JIT 後是純算術。
+    """
+    state = (h_now > H + delta) - (h_now < H - delta)
+    late = state > 0
+    return (late, max_ext * late, max_adv * late, 15 * (state < 0), state)
+
+
+if njit is not None:
+    _tsp_core = njit(cache=True)(_tsp_core)
+elif tsp_policy_c is not None:
+    # 沒有 Numba 的部署環境：改用 Cython 擴充，簽名與回傳值相同
+    _tsp_core = tsp_policy_c
+
+
+# 正常頭距是最常走的分支，而且它的決策不會被記進事件 log；
+# reason 用共用常數字串，省掉每步白做的 f-string 格式化。
+# TSPDecision 已是 frozen，正常分支直接回傳共用單例，連配置都免了
+_NORMAL_REASON = "Normal headway: within [H-delta, H+delta]"
+_NORMAL_DECISION = TSPDecision(reason=_NORMAL_REASON)
 
 
 def tsp_policy(
@@ -88,49 +162,54 @@ def tsp_policy(
         >>> assert decision.extend == 0 and decision.hold == 0
     """
     
-    decision = TSPDecision()
-    
-    # 晚點 / 頭距過大 → 給予 TSP 優先
-    if h_now > H + delta:
-        decision.grant = True
-        decision.extend = max_ext  # 給予最大延綠
-        decision.advance = max_adv  # 允許提前綠
-        decision.hold = 0
-        decision.reason = f"Late bus: headway {h_now:.0f}s > {H+delta:.0f}s"
-        
-    # 過早 / 要群聚 → 拒絕 TSP，考慮站點保留
-    elif h_now < H - delta:
-        decision.grant = False
-        decision.extend = 0
-        decision.advance = 0
-        decision.hold = 15  # 站點保留 15 秒
-        decision.reason = f"Early bus: headway {h_now:.0f}s < {H-delta:.0f}s"
-        
-    # 正常範圍 → 不需要 TSP
-    else:
-        decision.grant = False
-        decision.extend = 0
-        decision.advance = 0
-        decision.hold = 0
-        decision.reason = f"Normal headway: {h_now:.0f}s within [{H-delta:.0f}, {H+delta:.0f}]s"
-    
-    return decision
+    grant, extend, advance, hold, state = _tsp_core(h_now, H, delta, max_ext, max_adv)
 
+    # reason 只在包成 TSPDecision 時才格式化
+    if state > 0:    # 晚點 / 頭距過大 → 給予 TSP 優先
+        reason = f"Late bus: headway {h_now:.0f}s > {H+delta:.0f}s"
+    elif state < 0:  # 過早 / 要群聚 → 拒絕 TSP，考慮站點保留
+        reason = f"Early bus: headway {h_now:.0f}s < {H-delta:.0f}s"
+    else:            # 正常範圍 → 不需要 TSP，回傳共用單例，零配置
+        return _NORMAL_DECISION
 
-def calculate_headway(bus_times: list, target_bus_id: str = None) -> float:
+    return TSPDecision(grant=bool(grant), extend=int(extend),
+                       advance=int(advance), hold=int(hold), reason=reason)
+
+
+def tsp_policy_batch(h_now, H: float = 360, delta: float = 90,
+                     max_ext: int = 8, max_adv: int = 6):
     """
-    計算當前公車的頭距
-    
+    批次版 TSP 決策：一次對整批頭距做判斷
+
+    多路口廊道或情境掃描時，逐一呼叫 tsp_policy 的純量開銷會累積；
+    這裡以遮罩/np.where 一趟算完，語意與純量版逐項一致。
+
     Args:
-        bus_times: [(bus_id, timestamp), ...] 按時間排序的公車通過記錄
-        target_bus_id: 目標公車 ID，如果為 None 則計算最後兩台的頭距
-        
+        h_now: 頭距陣列 (秒)
+        H / delta / max_ext / max_adv: 同 tsp_policy
+
     Returns:
-        頭距 (秒)，如果無法計算則返回目標頭距
+        (grant, extend, advance, hold) 四個等長陣列
+    """
+    h = np.asarray(h_now, dtype=np.float64)
+    late = h > H + delta     # 晚點 → 給予優先
+    early = h < H - delta    # 過早 → 站點保留
+    extend = np.where(late, max_ext, 0)
+    advance = np.where(late, max_adv, 0)
+    hold = np.where(early, 15, 0)
+    return late, extend, advance, hold
+
+
+@lru_cache(maxsize=1024)
+def _headway_cached(bus_times: tuple, target_bus_id: Optional[str]) -> float:
+    """calculate_headway 的記憶化核心。
+
+    生產端每秒重新輪詢的多半是同一個通過時間窗，
+    tuple 當 key 讓重複視窗變成一次 dict 查找。
     """
     if len(bus_times) < 2:
         return 360  # 預設目標頭距
-    
+
     if target_bus_id:
         # 找到目標公車和前一台公車的時間
         target_idx = None
@@ -150,6 +229,38 @@ def calculate_headway(bus_times: list, target_bus_id: str = None) -> float:
         return bus_times[-1][1] - bus_times[-2][1]
 
 
+def calculate_headway(bus_times, target_bus_id: str = None, bus_ids=None) -> float:
+    """
+    計算當前公車的頭距
+
+    Args:
+        bus_times: [(bus_id, timestamp), ...] 按時間排序的公車通過記錄，
+            或到站時間的 np.ndarray（SoA 佈局）
+        target_bus_id: 目標公車 ID，如果為 None 則計算最後兩台的頭距
+        bus_ids: SoA 佈局時與 bus_times 對齊的公車 ID 陣列，
+            指定 target_bus_id 查詢時才需要
+
+    Returns:
+        頭距 (秒)，如果無法計算則返回目標頭距
+    """
+    if isinstance(bus_times, np.ndarray):
+        # SoA 到站時間陣列（尖峰時段一窗 20+ 台車）：
+        # C 層排序/diff 連續記憶體，免去 Python 物件迭代
+        times = bus_times
+        if times.size < 2:
+            return 360
+        if target_bus_id is not None and bus_ids is not None:
+            order = np.argsort(times, kind="stable")
+            sorted_t = times[order]
+            idx = np.flatnonzero(np.asarray(bus_ids)[order] == target_bus_id)
+            if idx.size == 0 or idx[0] == 0:
+                return 360
+            return float(sorted_t[idx[0]] - sorted_t[idx[0] - 1])
+        times = np.sort(times)
+        return float(times[-1] - times[-2])
+    return _headway_cached(tuple(bus_times), target_bus_id)
+
+
 def apply_tsp_to_phase(
     current_green_remaining: int,
     current_cycle_extensions: int,
@@ -170,6 +281,11 @@ def apply_tsp_to_phase(
     Returns:
         (實際延長秒數, 是否成功授予)
     """
+    # 有編譯好的 Cython 擴充就直接用：整數預算運算全在 C 層
+    if apply_tsp_c is not None:
+        return apply_tsp_c(current_cycle_extensions, decision.grant,
+                           decision.extend, max_cycle_extension)
+
     if not decision.grant:
         return 0, False
     
@@ -189,6 +305,39 @@ def apply_tsp_to_phase(
     return actual_extension, True
 
 
+def apply_tsp_to_phase_batch(
+    cycle_extensions,
+    grants,
+    extends,
+    max_cycle_extension: int = 10,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    批次版相位控制：一次對整批路口套用 TSP 決策
+
+    全市規模模擬一個 tick 要處理數百個路口，逐路口呼叫
+    apply_tsp_to_phase 的迴圈開銷會蓋過運算本身；
+    這裡用 NumPy ufunc 一趟算完，逐項語意與純量版一致。
+
+    Args:
+        cycle_extensions: 各路口本週期已延長秒數
+        grants: 各路口決策是否授予 (bool 陣列)
+        extends: 各路口請求的延綠秒數
+        max_cycle_extension: 每週期最大延長時間
+
+    Returns:
+        (實際延長秒數陣列, 是否成功授予陣列)
+    """
+    cycle_ext = np.asarray(cycle_extensions, dtype=np.int64)
+    req = np.asarray(extends, dtype=np.int64)
+    grant = np.asarray(grants, dtype=np.bool_)
+
+    budget = max_cycle_extension - cycle_ext
+    actual = np.minimum(req, budget).clip(0, None)
+    actual = np.where(grant, actual, 0)
+    granted = actual > 0
+    return actual, granted
+
+
 # 測試用例
 if __name__ == "__main__":
     print("=== TSP Policy Tests ===")
@@ -217,7 +366,8 @@ if __name__ == "__main__":
     # 測試 TSP Controller
     print("\n=== TSP Controller Tests ===")
     controller = TSPController()
-    current_time = time.time()
+    # 冷卻只看時間差：用 monotonic 免受牆鐘跳動影響，取樣也較便宜
+    current_time = time.monotonic()
     
     # 第一次授予應該成功
     can_grant_1 = controller.can_grant_tsp("J1", current_time, cooldown=60)
@@ -0,0 +1,41 @@
+"""
+測試共用設定
+backend 以可編輯安裝提供（pip install -e .），不再於此操作 sys.path
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def assets_root(tmp_path_factory):
+    """整個測試階段共用的暫存資產根目錄。
+
+    各測試以 request.node.name 子目錄隔離，
+    免得每個測試各自建立又刪除一棵暫存目錄。
+    """
+    return tmp_path_factory.mktemp("assets")
+
+
+@pytest.fixture(scope="session")
+def warmup_offsets():
+    """效能測試前先暖機一次 JIT 路徑，量到的才是穩態時間。"""
+    from core.glide.offsets import compute_offsets
+    compute_offsets([300] * 9)
+
+
+def pytest_configure(config):
+    # 註冊 xdist 分組標記：沒裝 pytest-xdist 時避免 unknown-marker 警告
+    config.addinivalue_line(
+        "markers", "xdist_group(name): keep the marked tests on one xdist worker")
+
+    # Numba 快取固定放在 repo 內，CI 把目錄 cache 起來即可跨次重用編譯結果；
+    # 必須搶在任何測試 import numba 之前設定
+    os.environ.setdefault(
+        "NUMBA_CACHE_DIR", str(Path(__file__).parent.parent / ".numba_cache"))
+
+    # 收集完、跑第一個測試前先把決策核心 JIT 付掉，計時測試量到的才是穩態
+    from core.glide.tsp import tsp_policy
+    tsp_policy(360, 360, 90)
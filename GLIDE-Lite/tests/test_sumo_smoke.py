@@ -6,16 +6,11 @@ GLIDE-Lite SUMO 模擬器煙霧測試
 
 import pytest
 import os
-import sys
-import tempfile
 import time
+from collections import deque
 from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
 
-# 添加 backend 模組路徑
-backend_path = Path(__file__).parent.parent / "backend"
-sys.path.insert(0, str(backend_path))
-
 # 檢查 SUMO 可用性
 SUMO_AVAILABLE = False
 try:
@@ -31,12 +26,20 @@ except ImportError:
 try:
     from core.glide.sumo_corridor import (
         SumoCorridorSimulator,
-        run_corridor
+        run_corridor,
+        vehicles_to_dicts,
+        tc
     )
 except ImportError as e:
     pytest.skip(f"Cannot import SUMO corridor module: {e}", allow_module_level=True)
 
 
+@pytest.fixture(scope="module")
+def mock_program_logics():
+    """預建的相位表 Mock：模組內共用一份，免得每個測試重建巢狀 Mock。"""
+    return [Mock(phases=[Mock(state="GGrrr")])]
+
+
 class TestSumoCorridorSimulator:
     """測試 SUMO 廊道模擬器類別"""
     
@@ -46,8 +49,8 @@ class TestSumoCorridorSimulator:
         
         assert sim.connection_label is None
         assert isinstance(sim.tsp_controller, object)
-        assert isinstance(sim.bus_passage_times, list)
-        assert isinstance(sim.events, list)
+        assert isinstance(sim.bus_passage_times, deque)
+        assert isinstance(sim.events, deque)
         assert len(sim.bus_passage_times) == 0
         assert len(sim.events) == 0
     
@@ -86,55 +89,66 @@ class TestSumoCorridorSimulator:
         sim.close_connection()
         assert sim.connection_label is None
     
-    def test_generate_additional_file(self):
+    def test_generate_additional_file(self, assets_root, request):
         """測試生成 additional.add.xml 檔案"""
-        with tempfile.TemporaryDirectory() as temp_dir:
-            assets_dir = Path(temp_dir)
-            offsets = {"J1": 0, "J2": 27, "J3": 52}
-            cycle = 90
-            
-            sim = SumoCorridorSimulator()
-            additional_file = sim.generate_additional_file(assets_dir, offsets, cycle)
-            
-            # 檢查檔案是否創建
-            assert additional_file.exists()
-            assert additional_file.name == "additional.add.xml"
-            
-            # 檢查 XML 內容
-            content = additional_file.read_text(encoding='utf-8')
-            assert "additionalFile" in content
-            assert "tlLogic" in content
-            assert 'id="J1"' in content
-            assert 'offset="0"' in content
-            assert 'offset="27"' in content
-            assert 'offset="52"' in content
+        assets_dir = assets_root / request.node.name
+        assets_dir.mkdir()
+        offsets = {"J1": 0, "J2": 27, "J3": 52}
+        cycle = 90
+
+        sim = SumoCorridorSimulator()
+        additional_file = sim.generate_additional_file(assets_dir, offsets, cycle)
+
+        # 檢查檔案是否創建（檔名帶參數雜湊）
+        assert additional_file.exists()
+        assert additional_file.name.startswith("additional.")
+        assert additional_file.name.endswith(".add.xml")
+
+        # 同參數再呼叫一次應回傳快取的同一路徑
+        assert sim.generate_additional_file(assets_dir, offsets, cycle) == additional_file
+
+        # 檢查 XML 內容
+        content = additional_file.read_text(encoding='utf-8')
+        assert "additionalFile" in content
+        assert "tlLogic" in content
+        assert 'id="J1"' in content
+        assert 'offset="0"' in content
+        assert 'offset="27"' in content
+        assert 'offset="52"' in content
 
 
 class TestMockSimulation:
     """使用 Mock 測試模擬功能 (不需要真實 SUMO)"""
     
     @patch('core.glide.sumo_corridor.traci')
-    def test_frame_data_collection_mock(self, mock_traci):
+    def test_frame_data_collection_mock(self, mock_traci, mock_program_logics):
         """測試數據收集 (Mock 版本)"""
         sim = SumoCorridorSimulator()
         sim.connection_label = "test_connection"
-        
-        # 模擬 TraCI 回應
-        mock_traci.trafficlight.getPhase.return_value = 0
-        mock_traci.trafficlight.getAllProgramLogics.return_value = [
-            Mock(phases=[Mock(state="GGrrr")])
-        ]
-        mock_traci.vehicle.getIDList.return_value = ["car_1", "bus_1"]
-        mock_traci.vehicle.getPosition.side_effect = [(100, 0), (-150, 0)]
-        mock_traci.vehicle.getTypeID.side_effect = ["passenger", "bus"]
-        
+
+        # 模擬 TraCI 回應（訂閱版介面）
+        mock_traci.trafficlight.getAllSubscriptionResults.return_value = {
+            tls_id: {tc.TL_CURRENT_PHASE: 0} for tls_id in ("J1", "J2", "J3")
+        }
+        mock_traci.trafficlight.getAllProgramLogics.return_value = mock_program_logics
+        mock_traci.simulation.getSubscriptionResults.return_value = {
+            tc.VAR_DEPARTED_VEHICLES_IDS: ["car_1", "bus_1"]
+        }
+        mock_traci.vehicle.getAllSubscriptionResults.return_value = {
+            "car_1": {tc.VAR_POSITION: (100, 0), tc.VAR_TYPE: "passenger"},
+            "bus_1": {tc.VAR_POSITION: (-150, 0), tc.VAR_TYPE: "bus"},
+        }
+
         frame_data = sim.collect_frame_data(30)
-        
+
         assert frame_data["t"] == 30
         assert len(frame_data["signals"]) == 3  # J1, J2, J3
-        assert len(frame_data["vehicles"]) == 2
-        assert frame_data["vehicles"][0]["kind"] == "car"
-        assert frame_data["vehicles"][1]["kind"] == "bus"
+        vehicles = vehicles_to_dicts(frame_data["vehicles"])
+        assert len(vehicles) == 2
+        assert vehicles[0]["kind"] == "car"
+        assert vehicles[1]["kind"] == "bus"
+        # 新出發的車應該被掛上位置/車種訂閱
+        assert mock_traci.vehicle.subscribe.call_count == 2
     
     def test_frame_data_structure(self):
         """測試 frame 數據結構"""
@@ -147,9 +161,14 @@ class TestMockSimulation:
         assert "signals" in frame_data
         assert "vehicles" in frame_data
         assert "events" in frame_data
-        assert isinstance(frame_data["signals"], list)
-        assert isinstance(frame_data["vehicles"], list)
-        assert isinstance(frame_data["events"], list)
+        # 無連線時回共用模板，空容器為不可變元組
+        assert isinstance(frame_data["signals"], (list, tuple))
+        assert isinstance(frame_data["events"], (list, tuple))
+        assert len(frame_data["signals"]) == 0
+        assert len(frame_data["events"]) == 0
+        # vehicles 為欄位式（SoA）結構
+        assert set(frame_data["vehicles"]) == {"ids", "x", "y", "kind"}
+        assert vehicles_to_dicts(frame_data["vehicles"]) == []
 
 
 @pytest.mark.skipif(not SUMO_AVAILABLE, reason="SUMO not available")
@@ -206,46 +225,47 @@ class TestRealSumoIntegration:
         
         return assets_dir
     
-    def test_minimal_simulation_run(self):
+    def test_minimal_simulation_run(self, assets_root, request):
         """測試最小化模擬運行"""
-        with tempfile.TemporaryDirectory() as temp_dir:
-            assets_dir = self.create_minimal_sumo_config(temp_dir)
-            
-            # 測試參數
-            offsets = {"J1": 0}  # 簡化的 offset
-            
-            try:
-                with SumoCorridorSimulator() as sim:
-                    # 嘗試啟動簡單模擬
-                    success = sim.start_simulation(
-                        assets_dir=assets_dir,
-                        offsets=offsets,
-                        cycle=60,
-                        steps=10,  # 很短的模擬
-                        seed=42
-                    )
+        temp_dir = assets_root / request.node.name
+        temp_dir.mkdir()
+        assets_dir = self.create_minimal_sumo_config(temp_dir)
+
+        # 測試參數
+        offsets = {"J1": 0}  # 簡化的 offset
+
+        try:
+            with SumoCorridorSimulator() as sim:
+                # 嘗試啟動簡單模擬
+                success = sim.start_simulation(
+                    assets_dir=assets_dir,
+                    offsets=offsets,
+                    cycle=60,
+                    steps=10,  # 很短的模擬
+                    seed=42
+                )
+                
+                if success:
+                    # 如果啟動成功，收集幾幀數據
+                    frames = []
+                    for step in range(5):
+                        import traci
+                        traci.switch(sim.connection_label)
+                        traci.simulationStep()
+                        frame = sim.collect_frame_data(step)
+                        frames.append(frame)
                     
-                    if success:
-                        # 如果啟動成功，收集幾幀數據
-                        frames = []
-                        for step in range(5):
-                            import traci
-                            traci.switch(sim.connection_label)
-                            traci.simulationStep()
-                            frame = sim.collect_frame_data(step)
-                            frames.append(frame)
-                        
-                        # 驗證結果
-                        assert len(frames) > 0
-                        assert all("t" in frame for frame in frames)
-                        
-                        # 基本 KPI 計算測試
-                        kpis = sim.calculate_kpis(frames)
-                        assert isinstance(kpis, dict)
+                    # 驗證結果
+                    assert len(frames) > 0
+                    assert all("t" in frame for frame in frames)
                     
-            except Exception as e:
-                # 如果 SUMO 環境有問題，記錄但不失敗
-                pytest.skip(f"SUMO environment issue: {e}")
+                    # 基本 KPI 計算測試
+                    kpis = sim.calculate_kpis(frames)
+                    assert isinstance(kpis, dict)
+                
+        except Exception as e:
+            # 如果 SUMO 環境有問題，記錄但不失敗
+            pytest.skip(f"SUMO environment issue: {e}")
 
 
 class TestRunCorridor:
@@ -336,25 +356,25 @@ class TestErrorHandling:
         assert isinstance(result, dict)
     
     @patch('core.glide.sumo_corridor.traci')
-    def test_simulation_crash_recovery(self, mock_traci):
+    def test_simulation_crash_recovery(self, mock_traci, assets_root, request):
         """測試模擬崩潰時的恢復"""
         # 模擬 TraCI 連接失敗
         mock_traci.start.side_effect = Exception("Connection failed")
-        
-        with tempfile.TemporaryDirectory() as temp_dir:
-            assets_dir = Path(temp_dir)
-            
-            result = run_corridor(
-                assets_dir=str(assets_dir),
-                mode="fixed",
-                cycle=90,
-                offsets={"J1": 0},
-                demand={},
-                tsp={},
-                steps=30
-            )
-            
-            assert "error" in result or "success" in result
+
+        assets_dir = assets_root / request.node.name
+        assets_dir.mkdir()
+
+        result = run_corridor(
+            assets_dir=str(assets_dir),
+            mode="fixed",
+            cycle=90,
+            offsets={"J1": 0},
+            demand={},
+            tsp={},
+            steps=30
+        )
+
+        assert "error" in result or "success" in result
 
 
 class TestPerformance:
@@ -369,34 +389,32 @@ class TestPerformance:
         sim = SumoCorridorSimulator()
         
         # 測試大量 frame 收集的效能
-        start_time = time.time()
+        start_ns = time.perf_counter_ns()
         frames = []
         for i in range(100):
             frame = sim.collect_frame_data(i)
             frames.append(frame)
-        end_time = time.time()
-        
-        # 應該很快完成 (< 1 秒)
-        assert end_time - start_time < 1.0
+        elapsed_ns = time.perf_counter_ns() - start_ns
+
+        # 應該很快完成 (< 1 秒)；perf_counter_ns 不受平台時鐘解析度限制
+        assert elapsed_ns < 1_000_000_000
         assert len(frames) == 100
     
     def test_memory_usage(self):
         """測試記憶體使用"""
         sim = SumoCorridorSimulator()
         
-        # 模擬長期運行，檢查記憶體洩漏
+        # 模擬長期運行，檢查記憶體洩漏：環形緩衝自動淘汰，無需手動清理
         for i in range(1000):
             sim.events.append({"t": i, "type": "test"})
             sim.bus_passage_times.append(("bus", i))
-            
-            # 定期清理 (模擬實際使用)
-            if i % 100 == 0:
-                sim.events = sim.events[-50:]  # 保留最近 50 個事件
-                sim.bus_passage_times = sim.bus_passage_times[-10:]  # 保留最近 10 個記錄
-        
+
         # 應該不會無限增長
         assert len(sim.events) <= 50
         assert len(sim.bus_passage_times) <= 10
+        # 保留的是最新的記錄
+        assert sim.events[-1]["t"] == 999
+        assert sim.bus_passage_times[-1] == ("bus", 999)
 
 
 if __name__ == "__main__":
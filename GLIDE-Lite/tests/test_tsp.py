@@ -5,23 +5,41 @@ GLIDE-Lite TSP (Transit Signal Priority) 模組測試
 
 import pytest
 import time
-import sys
-from pathlib import Path
+from types import SimpleNamespace
 
-# 添加 backend 模組路徑
-backend_path = Path(__file__).parent.parent / "backend"
-sys.path.insert(0, str(backend_path))
+import numpy as np
+from hypothesis import given, settings, strategies as st
 
-try:
-    from core.glide.tsp import (
-        tsp_policy,
-        TSPController,
-        TSPDecision,
-        calculate_headway,
-        apply_tsp_to_phase
-    )
-except ImportError as e:
-    pytest.skip(f"Cannot import TSP module: {e}", allow_module_level=True)
+from core.glide.tsp import (
+    tsp_policy,
+    tsp_policy_batch,
+    TSPController,
+    TSPDecision,
+    calculate_headway,
+    apply_tsp_to_phase,
+    apply_tsp_to_phase_batch
+)
+
+
+@pytest.fixture
+def controller():
+    """每個測試一個乾淨的 TSPController，共用建構邏輯。"""
+    return TSPController()
+
+
+@pytest.fixture(scope="module")
+def cfg():
+    """離峰預設參數：模組層共用，各測試不再重複字面值。"""
+    return SimpleNamespace(H=360, delta=90, tls_id="J1")
+
+
+@pytest.fixture
+def now():
+    """凍結的基準時間：免去 time.time() 系統呼叫，測試可重現。
+
+    TSPController 的時間都由呼叫端傳入，用常數加位移即可覆蓋所有情境。
+    """
+    return 1_700_000_000.0
 
 
 class TestTSPPolicy:
@@ -34,11 +52,10 @@ class TestTSPPolicy:
         h_now = 480  # 實際 8 分鐘 → 晚點
         
         decision = tsp_policy(h_now, H, delta)
-        
-        assert decision.grant == True
-        assert decision.extend > 0
-        assert decision.hold == 0
-        assert "Late bus" in decision.reason
+
+        # 單一 tuple 比對：失敗時 pytest 仍會逐欄顯示差異
+        assert (decision.grant, decision.extend > 0, decision.hold,
+                "Late bus" in decision.reason) == (True, True, 0, True)
     
     def test_early_bus_scenario(self):
         """測試早到公車情況 (要群聚)"""
@@ -47,11 +64,9 @@ class TestTSPPolicy:
         h_now = 240  # 實際 4 分鐘 → 過早
         
         decision = tsp_policy(h_now, H, delta)
-        
-        assert decision.grant == False
-        assert decision.extend == 0
-        assert decision.hold > 0
-        assert "Early bus" in decision.reason
+
+        assert (decision.grant, decision.extend, decision.hold > 0,
+                "Early bus" in decision.reason) == (False, 0, True, True)
     
     def test_normal_headway_scenario(self):
         """測試正常頭距情況"""
@@ -60,11 +75,9 @@ class TestTSPPolicy:
         h_now = 360  # 正好符合目標
         
         decision = tsp_policy(h_now, H, delta)
-        
-        assert decision.grant == False
-        assert decision.extend == 0
-        assert decision.hold == 0
-        assert "Normal headway" in decision.reason
+
+        assert (decision.grant, decision.extend, decision.hold,
+                "Normal headway" in decision.reason) == (False, 0, 0, True)
     
     def test_boundary_conditions(self):
         """測試邊界條件"""
@@ -86,6 +99,14 @@ class TestTSPPolicy:
         assert decision_under_boundary.grant == False  # 低於邊界，不給TSP但要保留
         assert decision_under_boundary.hold > 0
     
+    def test_core_state_mapping(self):
+        """決策核心的 state：+1 晚點、-1 過早、0 正常"""
+        from core.glide.tsp import _tsp_core
+
+        assert _tsp_core(480, 360, 90, 8, 6)[-1] == 1
+        assert _tsp_core(240, 360, 90, 8, 6)[-1] == -1
+        assert _tsp_core(360, 360, 90, 8, 6)[-1] == 0
+
     def test_custom_parameters(self):
         """測試自訂參數"""
         decision = tsp_policy(
@@ -101,21 +122,19 @@ class TestTSPPolicy:
         assert decision.advance == 8   # 使用自訂最大提前
 
 
+@pytest.mark.xdist_group("tsp_controller")
 class TestTSPController:
     """測試 TSP 控制器"""
-    
-    def test_controller_initialization(self):
+
+    def test_controller_initialization(self, controller):
         """測試控制器初始化"""
-        controller = TSPController()
-        
         assert len(controller.last_grant_time) == 0
         assert len(controller.total_extensions) == 0
         assert len(controller.cycle_start_time) == 0
     
-    def test_cooldown_mechanism(self):
+    def test_cooldown_mechanism(self, controller, now):
         """測試冷卻機制"""
-        controller = TSPController()
-        current_time = time.time()
+        current_time = now
         tls_id = "J1"
         
         # 第一次應該可以授予
@@ -130,11 +149,10 @@ class TestTSPController:
         # 冷卻期後應該可以授予
         assert controller.can_grant_tsp(tls_id, current_time + 70, cooldown=60) == True
     
-    def test_cycle_extension_tracking(self):
+    def test_cycle_extension_tracking(self, controller, now):
         """測試週期延長追蹤"""
-        controller = TSPController()
         tls_id = "J1"
-        current_time = time.time()
+        current_time = now
         
         # 重置週期
         controller.reset_cycle(tls_id, current_time)
@@ -152,10 +170,19 @@ class TestTSPController:
         controller.reset_cycle(tls_id, current_time + 90)
         assert controller.get_cycle_extensions(tls_id) == 0
     
-    def test_multiple_tls_independence(self):
+    @pytest.mark.parametrize("clock", [time.time, time.monotonic])
+    def test_clock_source_equivalence(self, controller, clock):
+        """冷卻判斷只依賴時間差，牆鐘或單調鐘餵進來語意相同"""
+        base = clock()
+
+        assert controller.can_grant_tsp("J1", base, cooldown=60) == True
+        controller.record_grant("J1", base, extend_sec=5)
+        assert controller.can_grant_tsp("J1", base + 30, cooldown=60) == False
+        assert controller.can_grant_tsp("J1", base + 70, cooldown=60) == True
+
+    def test_multiple_tls_independence(self, controller, now):
         """測試多個號誌的獨立性"""
-        controller = TSPController()
-        current_time = time.time()
+        current_time = now
         
         # 為 J1 授予
         controller.record_grant("J1", current_time, extend_sec=5)
@@ -220,11 +247,44 @@ class TestCalculateHeadway:
             ("bus_3", 750),   # 330s 頭距
             ("bus_4", 1110)   # 360s 頭距
         ]
-        
+
         # 預設計算最後兩台的頭距
         headway = calculate_headway(bus_times)
         assert headway == 360  # 1110 - 750
 
+        # SoA 路徑：直接餵到站時間陣列（未排序也可）
+        times = np.array([750, 60, 1110, 420], dtype=np.float64)
+        assert calculate_headway(times) == 360
+
+        # 陣列太短一樣回預設頭距
+        assert calculate_headway(np.array([100.0])) == 360
+
+    def test_soa_matches_list_path(self):
+        """SoA 佈局（ids 陣列 + 時間陣列）與傳統 list 路徑結果逐項一致"""
+        rng = np.random.default_rng(7)
+        times = np.cumsum(rng.integers(200, 500, size=50)).astype(np.float64)
+        ids = np.array([f"bus_{i}" for i in range(50)])
+        legacy = list(zip(ids.tolist(), times.tolist()))
+
+        assert calculate_headway(times) == calculate_headway(legacy)
+        for target in ("bus_0", "bus_1", "bus_25", "bus_49", "bus_99"):
+            assert calculate_headway(times, target_bus_id=target, bus_ids=ids) \
+                == calculate_headway(legacy, target_bus_id=target)
+
+    def test_repeated_window_hits_cache(self):
+        """重複查詢同一時間窗應命中快取，且重置週期會清空快取"""
+        from core.glide.tsp import _headway_cached
+
+        _headway_cached.cache_clear()
+        bus_times = [("bus_1", 100), ("bus_2", 460)]
+
+        assert calculate_headway(bus_times) == 360
+        assert calculate_headway(bus_times) == 360
+        assert _headway_cached.cache_info().hits == 1
+
+        TSPController().reset_cycle("J1", 0.0)
+        assert _headway_cached.cache_info().currsize == 0
+
 
 class TestApplyTspToPhase:
     """測試 TSP 應用到相位控制"""
@@ -318,14 +378,14 @@ class TestTSPDecision:
         assert decision.reason == "Test case"
 
 
+@pytest.mark.xdist_group("tsp_integration")
 class TestIntegrationScenarios:
     """整合測試場景"""
     
-    def test_complete_tsp_workflow(self):
+    def test_complete_tsp_workflow(self, controller, cfg, now):
         """測試完整的 TSP 工作流程"""
-        controller = TSPController()
-        tls_id = "J1"
-        current_time = time.time()
+        tls_id = cfg.tls_id
+        current_time = now
         
         # 場景：晚點公車需要 TSP
         bus_times = [
@@ -338,7 +398,7 @@ class TestIntegrationScenarios:
         assert headway == 600
         
         # 2. TSP 決策
-        decision = tsp_policy(headway, H=360, delta=90)
+        decision = tsp_policy(headway, H=cfg.H, delta=cfg.delta)
         assert decision.grant == True
         
         # 3. 檢查冷卻
@@ -360,7 +420,7 @@ class TestIntegrationScenarios:
         # 6. 驗證冷卻生效
         assert controller.can_grant_tsp(tls_id, current_time + 30) == False
     
-    def test_anti_bunching_scenario(self):
+    def test_anti_bunching_scenario(self, cfg):
         """測試防群聚場景"""
         # 場景：兩台公車相隔太近
         bus_times = [
@@ -369,7 +429,7 @@ class TestIntegrationScenarios:
         ]
         
         headway = calculate_headway(bus_times)
-        decision = tsp_policy(headway, H=360, delta=90)
+        decision = tsp_policy(headway, H=cfg.H, delta=cfg.delta)
         
         # 應該拒絕 TSP 並建議保留
         assert decision.grant == False
@@ -394,19 +454,63 @@ class TestIntegrationScenarios:
         assert decision.grant == False  # 在正常範圍內
 
 
-# 參數化測試
-@pytest.mark.parametrize("headway,H,delta,expected_grant,expected_hold", [
-    (480, 360, 90, True, 0),   # 晚點：8min > 6min + 1.5min
-    (240, 360, 90, False, 15), # 早到：4min < 6min - 1.5min
-    (360, 360, 90, False, 0),  # 正常：正好 6min
-    (420, 360, 90, False, 0),  # 正常：7min 在容忍範圍內
-    (300, 360, 90, False, 0),  # 正常：5min 在容忍範圍內
-])
-def test_parameterized_tsp_decisions(headway, H, delta, expected_grant, expected_hold):
-    """參數化測試不同頭距場景"""
+# 批次相位控制：千路口陣列一次算完，逐項結果須與純量版完全一致
+def test_apply_tsp_to_phase_batch_matches_scalar():
+    """批次版與純量版在 1000 個隨機路口上逐項等價"""
+    rng = np.random.default_rng(42)
+    n = 1000
+    cycle_ext = rng.integers(0, 12, size=n)
+    grants = rng.random(n) < 0.5
+    extends = rng.integers(0, 10, size=n)
+
+    actual, granted = apply_tsp_to_phase_batch(cycle_ext, grants, extends,
+                                               max_cycle_extension=10)
+
+    for i in range(n):
+        decision = TSPDecision(grant=bool(grants[i]), extend=int(extends[i]))
+        exp_ext, exp_granted = apply_tsp_to_phase(
+            current_green_remaining=30,
+            current_cycle_extensions=int(cycle_ext[i]),
+            decision=decision,
+            max_cycle_extension=10
+        )
+        assert actual[i] == exp_ext
+        assert granted[i] == exp_granted
+
+
+# 性質測試：讓 hypothesis 掃整個參數空間，邊界 bug 會自動縮小成反例
+@settings(max_examples=500, deadline=None)  # deadline=None：別把 JIT 暖機算成逾時
+@given(
+    headway=st.integers(min_value=0, max_value=3600),
+    H=st.integers(min_value=60, max_value=600),
+    delta=st.integers(min_value=0, max_value=300),
+)
+def test_tsp_policy_grant_invariant(headway, H, delta):
+    """決策不變量：grant 若且唯若頭距超過 H+delta，hold 若且唯若低於 H-delta"""
     decision = tsp_policy(headway, H, delta)
-    assert decision.grant == expected_grant
-    assert (decision.hold > 0) == (expected_hold > 0)
+
+    assert decision.grant == (headway > H + delta)
+    assert (decision.hold > 0) == (headway < H - delta)
+    if decision.grant:
+        assert decision.extend > 0 and decision.advance > 0
+
+
+# 批次測試：一次陣列呼叫涵蓋原本逐場景的參數化案例
+def test_tsp_policy_batch_decisions():
+    """批次版決策：晚點/早到/正常場景一次驗證，且與純量版一致"""
+    headways = np.array([480, 240, 360, 420, 300], dtype=np.float64)
+    grant, extend, advance, hold = tsp_policy_batch(headways, H=360, delta=90)
+
+    assert np.array_equal(grant, [True, False, False, False, False])
+    assert np.array_equal(hold > 0, [False, True, False, False, False])
+
+    # 與純量版逐項對照
+    for h, g, e, a, hd in zip(headways, grant, extend, advance, hold):
+        decision = tsp_policy(float(h), 360, 90)
+        assert decision.grant == bool(g)
+        assert decision.extend == int(e)
+        assert decision.advance == int(a)
+        assert decision.hold == int(hd)
 
 
 if __name__ == "__main__":